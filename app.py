@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
+import threading
 import time
-from rag_agent import WebScraper, TextChunker, RAGPipeline, SimpleVectorDB
+from rag_agent import WebScraper, TextChunker, RAGPipeline, SimpleVectorDB, AnswerCache, ChunkDeduplicator, ContextPacker, METRICS
 
 
 st.set_page_config(
@@ -67,14 +68,159 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-if 'scraped_data' not in st.session_state:
-    st.session_state.scraped_data = None
-if 'chunks' not in st.session_state:
-    st.session_state.chunks = []
+class IndexSlot:
+    # One crawl configuration, shared by every browser session in this process.
+    # `vector_db` is the last completed index; a refresh builds a new one in a
+    # background thread and swaps it in only when it is complete, so queries
+    # keep working against the old index meanwhile.
+    def __init__(self, url, max_pages, chunk_size, chunk_overlap, splitter, dedup):
+        self.url = url
+        self.max_pages = max_pages
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.splitter = splitter
+        self.dedup = dedup
+        self.lock = threading.Lock()
+        self.vector_db = None
+        self.scraped_data = []
+        self.dedup_summary = None
+        self.completed_at = None
+        self.job = None
+        self.last_used = time.time()
+
+    def is_running(self):
+        return self.job is not None and self.job['status'] == 'running'
+
+    def start_refresh(self, api_key, crawl_workers, rate_limit):
+        with self.lock:
+            if self.is_running():
+                return False
+            self.job = {'status': 'running', 'pages': 0, 'chunked': 0, 'chunks': 0, 'error': None,
+                        'started': time.time()}
+            job = self.job
+        threading.Thread(target=self._build, args=(job, api_key, crawl_workers, rate_limit), daemon=True).start()
+        return True
+
+    def _build(self, job, api_key, crawl_workers, rate_limit):
+        try:
+            scraper = WebScraper(self.url, max_pages=self.max_pages, workers=crawl_workers,
+                                 requests_per_second=rate_limit)
+            chunker = TextChunker(chunk_size=self.chunk_size, overlap=self.chunk_overlap, splitter=self.splitter)
+            deduplicator = ChunkDeduplicator() if self.dedup else None
+            # The pipeline is only used to build the index; sessions query the
+            # finished vector_db through their own pipeline and API key.
+            builder = RAGPipeline(api_key)
+            
+            # Only a small summary of each page is kept; the text itself goes
+            # straight through chunking into the index.
+            scraped_data = []
+            
+            def summarized_pages():
+                for page in scraper.iter_pages():
+                    scraped_data.append({
+                        'url': page['url'],
+                        'length': len(page['text']),
+                        'preview': page['text'][:100] + "..." if len(page['text']) > 100 else page['text']
+                    })
+                    job['pages'] = len(scraped_data)
+                    yield page
+            
+            def report_progress(pages, chunks):
+                job['chunked'] = pages
+                job['chunks'] = chunks
+            
+            builder.index_stream(summarized_pages(), chunker, progress=report_progress, deduplicator=deduplicator)
+            if not scraped_data:
+                raise ValueError("No data could be scraped from the provided URL.")
+            # Fit before publishing so concurrent sessions never refresh it.
+            builder.vector_db.refresh()
+            
+            with self.lock:
+                self.vector_db = builder.vector_db
+                self.scraped_data = scraped_data
+                self.dedup_summary = deduplicator.summary() if deduplicator is not None else None
+                self.completed_at = time.time()
+                job['status'] = 'done'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+
+class SlotRegistry:
+    # The process's IndexSlots by crawl configuration. Each slot holds a full
+    # index in memory, so slots that have not been asked for in idle_seconds
+    # are dropped, and beyond max_slots the least recently used ones go.
+    # A slot whose background job is still running is never dropped.
+    def __init__(self, max_slots=8, idle_seconds=6 * 3600):
+        self.max_slots = max_slots
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.slots = {}
+
+    def get(self, params):
+        with self.lock:
+            now = time.time()
+            slot = self.slots.get(params)
+            if slot is None:
+                slot = self.slots[params] = IndexSlot(*params)
+            slot.last_used = now
+            self._evict(now)
+            return slot
+
+    def _evict(self, now):
+        idle = sorted((slot.last_used, params) for params, slot in self.slots.items() if not slot.is_running())
+        for last_used, params in idle:
+            if now - last_used > self.idle_seconds or len(self.slots) > self.max_slots:
+                del self.slots[params]
+
+@st.cache_resource(show_spinner=False)
+def get_slot_registry():
+    return SlotRegistry()
+
+def get_index_slot(url, max_pages, chunk_size, chunk_overlap, splitter, dedup):
+    return get_slot_registry().get((url, max_pages, chunk_size, chunk_overlap, splitter, dedup))
+
+@st.cache_resource(show_spinner=False)
+def get_answer_cache():
+    return AnswerCache()
+
+def session_pipeline(slot):
+    # Rebuilt when the shared index is swapped or the key or model changes.
+    key = (id(slot.vector_db), api_key, model)
+    if st.session_state.pipeline_key != key:
+        st.session_state.rag_pipeline = RAGPipeline(api_key, model=model, vector_db=slot.vector_db,
+                                                    answer_cache=get_answer_cache())
+        st.session_state.pipeline_key = key
+    return st.session_state.rag_pipeline
+
+@st.fragment(run_every=1.0)
+def show_job_progress(slot):
+    # Polls the background job; the rest of the page stays interactive.
+    job = slot.job
+    if job is None:
+        return
+    if job['status'] == 'running':
+        st.progress(min(1.0, job['pages'] / slot.max_pages),
+                    text=f"Scraped {job['pages']} of up to {slot.max_pages} pages, "
+                         f"indexed {job['chunks']} text chunks from {job['chunked']} pages...")
+        if slot.vector_db is not None:
+            st.caption("Questions are answered from the previous index until the refresh completes.")
+    elif job['status'] == 'failed':
+        st.error(f"An error occurred during scraping: {job['error']}")
+    elif st.session_state.seen_completed_at == slot.completed_at:
+        st.success(f"Successfully scraped and indexed {len(slot.vector_db.documents)} text chunks "
+                   f"from {len(slot.scraped_data)} pages.")
+    if slot.completed_at != st.session_state.seen_completed_at:
+        # A new index was published; rerun the whole page to show it.
+        st.rerun()
+
+if 'slot_params' not in st.session_state:
+    st.session_state.slot_params = None
 if 'rag_pipeline' not in st.session_state:
     st.session_state.rag_pipeline = None
-if 'scraping_complete' not in st.session_state:
-    st.session_state.scraping_complete = False
+if 'pipeline_key' not in st.session_state:
+    st.session_state.pipeline_key = None
+if 'seen_completed_at' not in st.session_state:
+    st.session_state.seen_completed_at = None
 if 'query_history' not in st.session_state:
     st.session_state.query_history = []
 
@@ -119,7 +265,9 @@ with st.sidebar:
     - Generates accurate responses with sources
     """)
 
-tab1, tab2 = st.tabs(["🕸️ Web Scraping", "❓ Query System"])
+slot = get_index_slot(*st.session_state.slot_params) if st.session_state.slot_params else None
+
+tab1, tab2, tab3 = st.tabs(["🕸️ Web Scraping", "❓ Query System", "📈 Diagnostics"])
 
 with tab1:
     col1, col2 = st.columns([2, 1])
@@ -138,67 +286,46 @@ with tab1:
         col1, col2 = st.columns(2)
         with col1:
             chunk_size = st.number_input("Text Chunk Size", min_value=100, max_value=2000, value=512)
+            crawl_workers = st.number_input("Concurrent Fetch Workers", min_value=1, max_value=16, value=4)
+            splitter = st.selectbox("Sentence Splitter", options=["nltk", "regex"],
+                                    help="The regex splitter is much faster and approximates NLTK's boundaries")
         with col2:
             chunk_overlap = st.number_input("Chunk Overlap", min_value=0, max_value=500, value=50)
+            rate_limit = st.number_input("Requests per Second (per host)", min_value=0.5, max_value=20.0, value=4.0, step=0.5)
+            dedup = st.checkbox("Merge Near-Duplicate Chunks", value=True,
+                                help="Index repeated boilerplate such as footers and sidebars only once")
             
+    slot_params = (website_url, max_pages, chunk_size, chunk_overlap, splitter, dedup)
     if st.button("🚀 Start Scraping", use_container_width=True, type="primary", 
                 disabled=not website_url or not api_key):
-        with st.spinner("Scraping website... This may take a few minutes depending on site size."):
-            try:
-                st.session_state.scraping_complete = False
-                st.session_state.scraped_data = None
-                st.session_state.chunks = []
-                
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                status_text.text("Initializing scraper...")
-                scraper = WebScraper(website_url, max_pages=max_pages)
-                
-                status_text.text("Scraping pages...")
-                scraped_data = scraper.scrape()
-                progress_bar.progress(40)
-                
-                if not scraped_data:
-                    st.error("No data could be scraped from the provided URL.")
-                else:
-                    status_text.text("Processing and chunking text...")
-                    chunker = TextChunker(chunk_size=chunk_size, overlap=chunk_overlap)
-                    chunks = []
-                    for data in scraped_data:
-                        chunks.extend(chunker.chunk_text(data['text'], data['url']))
-                    
-                    progress_bar.progress(70)
-                    
-                    status_text.text("Setting up RAG pipeline and indexing documents...")
-                    rag_pipeline = RAGPipeline(api_key, model=model)
-                    
-                    rag_pipeline.index_documents(chunks)
-                    progress_bar.progress(100)
-                    
-                    st.session_state.scraped_data = scraped_data
-                    st.session_state.chunks = chunks
-                    st.session_state.rag_pipeline = rag_pipeline
-                    st.session_state.scraping_complete = True
-                    
-                    status_text.empty()
-                    
-                    st.success(f"Successfully scraped and indexed {len(chunks)} text chunks from {len(scraped_data)} pages.")
-                    
-            except Exception as e:
-                st.error(f"An error occurred during scraping: {str(e)}")
+        # Sessions asking for the same site and settings share one index;
+        # only the first one to ask actually crawls it.
+        st.session_state.slot_params = slot_params
+        slot = get_index_slot(*slot_params)
+        if slot.vector_db is None:
+            slot.start_refresh(api_key, crawl_workers, rate_limit)
+        else:
+            st.info(f"Using the index built {int(time.time() - slot.completed_at)} seconds ago. "
+                    "Use Refresh Index below to crawl the site again.")
+    
+    if slot is not None:
+        st.session_state.seen_completed_at = slot.completed_at
+        show_job_progress(slot)
     
-    if st.session_state.scraping_complete and st.session_state.scraped_data:
+    if slot is not None and slot.vector_db is not None:
         st.divider()
         
         st.markdown("<h3>📊 Scraping Metrics</h3>", unsafe_allow_html=True)
         
+        vector_db = slot.vector_db
+        scraped_data = slot.scraped_data
+        
         col1, col2, col3 = st.columns(3)
         with col1:
             st.markdown(f"""
             <div class='metric-card'>
                 <h4>Pages Scraped</h4>
-                <h2>{len(st.session_state.scraped_data)}</h2>
+                <h2>{len(scraped_data)}</h2>
             </div>
             """, unsafe_allow_html=True)
         
@@ -206,12 +333,12 @@ with tab1:
             st.markdown(f"""
             <div class='metric-card'>
                 <h4>Text Chunks</h4>
-                <h2>{len(st.session_state.chunks)}</h2>
+                <h2>{len(vector_db.documents)}</h2>
             </div>
             """, unsafe_allow_html=True)
             
         with col3:
-            avg_chunk_length = sum(len(chunk['text']) for chunk in st.session_state.chunks) / max(1, len(st.session_state.chunks))
+            avg_chunk_length = (vector_db.store.ends - vector_db.store.starts).mean() if len(vector_db.store) else 0
             st.markdown(f"""
             <div class='metric-card'>
                 <h4>Avg. Chunk Size</h4>
@@ -219,30 +346,42 @@ with tab1:
             </div>
             """, unsafe_allow_html=True)
         
+        if slot.dedup_summary:
+            st.caption(slot.dedup_summary)
+        
+        if st.button("🔄 Refresh Index", use_container_width=True, disabled=slot.is_running() or not api_key,
+                     help="Crawl the site again; questions are answered from the current index until it finishes"):
+            slot.start_refresh(api_key, crawl_workers, rate_limit)
+            st.rerun()
+        
         with st.expander("📑 View Scraped Pages"):
             pages_df = pd.DataFrame([
                 {"URL": data['url'], 
-                 "Content Length": len(data['text']),
-                 "Preview": data['text'][:100] + "..." if len(data['text']) > 100 else data['text']}
-                for data in st.session_state.scraped_data
+                 "Content Length": data['length'],
+                 "Preview": data['preview']}
+                for data in scraped_data
             ])
             
             st.dataframe(pages_df, use_container_width=True)
         
         with st.expander("🧩 View Text Chunks"):
             chunks_df = pd.DataFrame([
-                {"Source URL": chunk['url'], 
-                 "Length": len(chunk['text']),
-                 "Content": chunk['text'][:100] + "..." if len(chunk['text']) > 100 else chunk['text']}
-                for chunk in st.session_state.chunks
+                {"Source URL": url, 
+                 "Length": len(text),
+                 "Content": text[:100] + "..." if len(text) > 100 else text}
+                for url, text in zip(vector_db.urls, vector_db.documents)
             ])
             
             st.dataframe(chunks_df, use_container_width=True)
 
 with tab2:
-    if not st.session_state.scraping_complete:
+    if slot is None or slot.vector_db is None:
         st.warning("Please scrape a website first (in the Web Scraping tab) before asking questions.")
     else:
+        rag_pipeline = session_pipeline(slot)
+        if slot.is_running():
+            st.info("The index is being refreshed; answers use the last completed index until it finishes.")
+        
         st.markdown("<h3>🔎 Ask About the Scraped Content</h3>", unsafe_allow_html=True)
         
         query = st.text_input("Enter your question", 
@@ -252,36 +391,56 @@ with tab2:
         col1, col2 = st.columns([1, 3])
         with col1:
             top_k = st.number_input("Number of sources to use", min_value=1, max_value=10, value=3)
+            context_tokens = st.number_input("Context Token Budget", min_value=200, max_value=8000, value=2000, step=100)
         
         if st.button("🔍 Search", use_container_width=True, type="primary", disabled=not query):
-            with st.spinner("Retrieving relevant information and generating response..."):
-                try:
-                    retrieved_docs = st.session_state.rag_pipeline.retrieve(query, top_k=top_k)
-                    
-                    start_time = time.time()
-                    response = st.session_state.rag_pipeline.generate(query, retrieved_docs)
-                    generation_time = time.time() - start_time
-                    
-                    st.session_state.query_history.append((query, response))
-                    
-                    st.markdown("<div class='response-container'>", unsafe_allow_html=True)
-                    st.markdown("### 📝 Answer")
-                    st.write(response["answer"])
-                    
-                    if response["sources"]:
-                        st.markdown("### 📚 Sources")
-                        for idx, source in enumerate(response["sources"]):
-                            st.markdown(f"""
-                            <div class='source-box'>
-                                <strong>Source {idx+1}:</strong> <a href="{source}" target="_blank">{source}</a>
-                            </div>
-                            """, unsafe_allow_html=True)
-                    
-                    st.caption(f"Response generated in {generation_time:.2f} seconds using {selected_model}")
-                    st.markdown("</div>", unsafe_allow_html=True)
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
+            try:
+                with st.spinner("Retrieving relevant information..."):
+                    retrieved_docs = rag_pipeline.retrieve(query, top_k=top_k)
+                    rag_pipeline.context_packer = ContextPacker(max_tokens=context_tokens)
+                
+                st.markdown("<div class='response-container'>", unsafe_allow_html=True)
+                st.markdown("### 📝 Answer")
+                answer_box = st.empty()
+                answer_box.caption("Waiting for the model...")
+                
+                streamed = ""
+                response = None
+                for event in rag_pipeline.generate_stream(query, retrieved_docs):
+                    if event['type'] == 'delta':
+                        streamed += event['text']
+                        answer_box.markdown(streamed + "▌")
+                    else:
+                        response = event
+                answer_box.markdown(response["answer"])
+                
+                st.session_state.query_history.append((query, response))
+                
+                if response["sources"]:
+                    st.markdown("### 📚 Sources")
+                    for idx, source in enumerate(response["sources"]):
+                        st.markdown(f"""
+                        <div class='source-box'>
+                            <strong>Source {idx+1}:</strong> <a href="{source}" target="_blank">{source}</a>
+                        </div>
+                        """, unsafe_allow_html=True)
+                
+                if response.get("cached"):
+                    cache_metrics = rag_pipeline.answer_cache.metrics()
+                    st.caption(f"Answer served from cache ({cache_metrics['hit_rate']:.0%} hit rate, "
+                               f"{cache_metrics['latency_saved']:.1f} seconds of generation saved so far)")
+                else:
+                    first_token = response["time_to_first_token"]
+                    first_token_text = f"first token after {first_token:.2f}s, " if first_token is not None else ""
+                    st.caption(f"Response generated in {response['generation_time']:.2f} seconds "
+                               f"({first_token_text}using {selected_model})")
+                if response.get("prompt_tokens"):
+                    st.caption(f"Prompt: ~{response['prompt_tokens']['after']} tokens "
+                               f"(~{response['prompt_tokens']['before']} before context packing)")
+                st.markdown("</div>", unsafe_allow_html=True)
+                
+            except Exception as e:
+                st.error(f"An error occurred: {str(e)}")
         
         if st.session_state.query_history:
             with st.expander("📜 View Previous Queries and Responses"):
@@ -290,4 +449,45 @@ with tab2:
                     st.markdown(f"A: {past_response['answer']}")
                     st.divider()
 
+with tab3:
+    st.markdown("<h3>📈 Pipeline Metrics</h3>", unsafe_allow_html=True)
+    metrics = METRICS.snapshot()
+    if not metrics:
+        st.info("No metrics recorded yet. Scrape a website or ask a question first.")
+    else:
+        histograms = [m for m in metrics if m['type'] == 'histogram']
+        if histograms:
+            st.markdown("#### ⏱️ Timings")
+            st.dataframe(pd.DataFrame([
+                {"Metric": m['name'],
+                 "Labels": ", ".join(f"{k}={v}" for k, v in m['labels'].items()),
+                 "Count": m['count'],
+                 "Total": round(m['sum'], 4),
+                 "Mean": round(m['sum'] / m['count'], 4) if m['count'] else 0.0}
+                for m in histograms
+            ]), use_container_width=True)
+        
+        values = [m for m in metrics if m['type'] != 'histogram']
+        if values:
+            st.markdown("#### 🔢 Counters and Gauges")
+            st.dataframe(pd.DataFrame([
+                {"Metric": m['name'],
+                 "Labels": ", ".join(f"{k}={v}" for k, v in m['labels'].items()),
+                 "Type": m['type'],
+                 "Value": m['value']}
+                for m in values
+            ]), use_container_width=True)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.download_button("Download Prometheus", METRICS.to_prometheus(), file_name="metrics.prom",
+                               use_container_width=True)
+        with col2:
+            st.download_button("Download JSON", METRICS.to_json(), file_name="metrics.json",
+                               use_container_width=True)
+        with col3:
+            if st.button("Reset Metrics", use_container_width=True):
+                METRICS.reset()
+                st.rerun()
+
 st.markdown("<div class='footer'>Knowledge Navigator</div>", unsafe_allow_html=True)
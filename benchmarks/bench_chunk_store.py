@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_chunking import make_pages
+from rag_agent import ChunkStore, TextChunker
+
+
+def measure(build):
+    tracemalloc.start()
+    kept = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return kept, current
+
+
+def legacy_lists(chunks):
+    # The previous layout: one string per chunk text and one URL string per
+    # chunk, as read back from index.json.
+    texts = [chunk['page'][chunk['start']:chunk['end']] for chunk in chunks]
+    urls = json.loads(json.dumps([chunk['url'] for chunk in chunks]))
+    return texts, urls
+
+
+def compact_store(chunks):
+    store = ChunkStore()
+    copies = {}
+    for chunk in chunks:
+        # Copy each page once so its text is counted inside the measurement.
+        page = copies.setdefault(id(chunk['page']), chunk['page'].encode('utf-8').decode('utf-8'))
+        store.add_chunk(store.add_page(page, chunk['url']), chunk['start'], chunk['end'])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory per chunk of the compact ChunkStore vs per-chunk string lists")
+    parser.add_argument("--pages", type=int, default=2000, help="Number of synthetic pages")
+    parser.add_argument("--sentences", type=int, default=80, help="Sentences per page")
+    parser.add_argument("--chunk_size", type=int, default=512)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages, args.sentences)
+    for page in pages:
+        page['url'] = page['url'].replace('https://example.com/', 'https://docs.example.com/guides/section/')
+    chunks = TextChunker(chunk_size=args.chunk_size, overlap=args.overlap, splitter='regex').chunk_many(pages)
+    n = len(chunks)
+    print(f"corpus: {len(pages)} pages, {sum(len(page['text']) for page in pages) / 1e6:.1f} MB, {n} chunks")
+
+    _, legacy_bytes = measure(lambda: legacy_lists(chunks))
+    store, compact_bytes = measure(lambda: compact_store(chunks))
+
+    with tempfile.TemporaryDirectory() as path:
+        meta = store.save(path)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        # Loaded indexes memory-map the texts, so only per-chunk metadata stays in RAM.
+        _, legacy_loaded = measure(lambda: (json.loads(json.dumps([chunk['url'] for chunk in chunks])),
+                                            offsets.copy()))
+        loaded, compact_loaded = measure(lambda: ChunkStore.load(path, meta))
+        assert [loaded.text(i) for i in range(0, n, 97)] == [chunks[i]['text'] for i in range(0, n, 97)]
+        del loaded
+        on_disk = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    print(f"{'layout':<28}{'bytes/chunk':>12}{'total MB':>10}")
+    print(f"{'lists, in memory':<28}{legacy_bytes / n:>12.1f}{legacy_bytes / 1e6:>10.1f}")
+    print(f"{'ChunkStore, in memory':<28}{compact_bytes / n:>12.1f}{compact_bytes / 1e6:>10.1f}")
+    print(f"{'lists, loaded (mmap texts)':<28}{legacy_loaded / n:>12.1f}{legacy_loaded / 1e6:>10.1f}")
+    print(f"{'ChunkStore, loaded':<28}{compact_loaded / n:>12.1f}{compact_loaded / 1e6:>10.1f}")
+    print(f"in memory: {legacy_bytes / compact_bytes:.2f}x smaller; loaded: {legacy_loaded / compact_loaded:.1f}x smaller; "
+          f"ChunkStore files on disk: {on_disk / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import random
+import time
+
+from rag_agent import TextChunker
+
+REFERENCE_PARAGRAPHS = [
+    "Welcome to the documentation. This guide explains how to install the package, configure it and run "
+    "your first crawl. If anything is unclear, open an issue on the tracker!",
+    "Dr. Smith and Mr. Jones reviewed the proposal on Jan. 5 and approved it. The budget, approx. 2.5 million "
+    "dollars, covers hardware, e.g. servers and storage, and staff. Is that enough? Probably not.",
+    "The API returns JSON. Each response includes a status field, a data field and, where relevant, an error "
+    "message. Requests are rate limited to 10 per second per key; exceeding the limit returns HTTP 429.",
+    "Version 3.2 introduced streaming. Older clients (before v3) must upgrade. See the migration notes at "
+    "example.com/docs/migrate for details. J. R. Doe wrote most of the new code.",
+    "Caching is enabled by default... but it can be turned off. Set CACHE_ENABLED=false in the environment. "
+    "Then restart the service. \"Why would I do that?\" you may ask. Mostly for debugging.",
+]
+
+WORDS = ("index crawler page query model answer token vector chunk source context latency cache "
+         "network parser document retrieval score").split()
+
+
+def make_pages(n_pages, sentences_per_page, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n_pages):
+        sentences = []
+        for _ in range(sentences_per_page):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+            sentences.append(sentence.capitalize() + rng.choice(".!?."))
+        pages.append({'url': f"https://example.com/page/{i}", 'text': " ".join(sentences)})
+    return pages
+
+
+def boundary_agreement(pages, method, chunk_size=512, show_mismatches=False):
+    # Share of spans that the nltk and regex splitters agree on, for either
+    # the 'sentence_spans' or the 'chunk_spans' method of TextChunker.
+    nltk_chunker = TextChunker(chunk_size=chunk_size, overlap=0, splitter='nltk')
+    regex_chunker = TextChunker(chunk_size=chunk_size, overlap=0, splitter='regex')
+    matching = total = 0
+    for page in pages:
+        expected = set(getattr(nltk_chunker, method)(page['text']))
+        found = set(getattr(regex_chunker, method)(page['text']))
+        matching += len(expected & found)
+        total += len(expected | found)
+        if show_mismatches:
+            for start, end in sorted(expected - found):
+                print(f"  nltk only:  {page['text'][start:end]!r}")
+            for start, end in sorted(found - expected):
+                print(f"  regex only: {page['text'][start:end]!r}")
+    return matching / max(1, total)
+
+
+def timed(label, chunker, pages, total_chars):
+    start = time.perf_counter()
+    chunks = chunker.chunk_many(pages)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<26}{elapsed:>9.3f}s{total_chars / elapsed / 1e6:>10.2f} MB/s{len(chunks):>10} chunks")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TextChunker throughput and regex/NLTK boundary agreement")
+    parser.add_argument("--pages", type=int, default=400, help="Number of synthetic pages")
+    parser.add_argument("--sentences", type=int, default=400, help="Sentences per page")
+    parser.add_argument("--workers", type=int, default=4, help="Process pool size for chunk_many")
+    parser.add_argument("--reference_chunk_size", type=int, default=80,
+                        help="Chunk size for the reference corpus, small enough to split every paragraph")
+    args = parser.parse_args()
+
+    pages = make_pages(args.pages, args.sentences)
+    total_chars = sum(len(page['text']) for page in pages)
+    print(f"corpus: {len(pages)} pages, {total_chars / 1e6:.1f} MB")
+
+    try:
+        TextChunker(splitter='nltk').chunk_spans("Warm up. Load the model.")
+        has_punkt = True
+    except LookupError:
+        has_punkt = False
+        print("NLTK punkt data not available; skipping the nltk splitter and the agreement check")
+
+    splitters = ['nltk', 'regex'] if has_punkt else ['regex']
+    for splitter in splitters:
+        timed(f"{splitter} (1 process)", TextChunker(splitter=splitter), pages, total_chars)
+        chunker = TextChunker(splitter=splitter, workers=args.workers)
+        timed(f"{splitter} ({args.workers} processes)", chunker, pages, total_chars)
+        chunker.close()
+
+    if has_punkt:
+        # The reference paragraphs are shorter than a default chunk, so their
+        # abbreviations, initials and ellipses are checked as sentence
+        # boundaries and as boundaries of small chunks.
+        reference = [{'url': str(i), 'text': text} for i, text in enumerate(REFERENCE_PARAGRAPHS)]
+        print("sentence boundary agreement (reference corpus):")
+        agreement = boundary_agreement(reference, 'sentence_spans', show_mismatches=True)
+        print(f"  {agreement:.3f}")
+        print(f"chunk boundary agreement (reference corpus, chunk_size={args.reference_chunk_size}): "
+              f"{boundary_agreement(reference, 'chunk_spans', args.reference_chunk_size):.3f}")
+        print(f"sentence boundary agreement (synthetic corpus): "
+              f"{boundary_agreement(pages[:50], 'sentence_spans'):.3f}")
+        print(f"chunk boundary agreement (synthetic corpus): {boundary_agreement(pages[:50], 'chunk_spans'):.3f}")
+
+
+if __name__ == "__main__":
+    main()
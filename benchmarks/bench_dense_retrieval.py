@@ -0,0 +1,86 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from rag_agent import DenseVectorIndex, SimpleVectorDB
+
+
+def make_corpus(n_docs, n_topics, seed=0):
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(n_topics * 40)]
+    topics = [vocab[i * 40:(i + 1) * 40] for i in range(n_topics)]
+    docs = []
+    for _ in range(n_docs):
+        main, other = rng.sample(topics, 2)
+        words = [rng.choice(main) for _ in range(45)] + [rng.choice(other) for _ in range(15)]
+        rng.shuffle(words)
+        docs.append(" ".join(words))
+    # Queries paraphrase a random chunk with a subset of its words, so each
+    # has a clear best match rather than a tie across a whole topic.
+    queries = [" ".join(rng.sample(rng.choice(docs).split(), 12)) for _ in range(200)]
+    return docs, queries
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1000
+    return np.percentile(samples, 50), np.percentile(samples, 99)
+
+
+def timed_queries(search, queries, top_k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query, top_k))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def recall_at_k(exact, approximate):
+    hits = total = 0
+    for expected, found in zip(exact, approximate):
+        expected_texts = {doc['text'] for doc in expected}
+        hits += len(expected_texts & {doc['text'] for doc in found})
+        total += len(expected_texts)
+    return hits / max(1, total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and latency of the dense ANN backend vs exact TF-IDF search")
+    parser.add_argument("--docs", type=int, default=20000, help="Number of synthetic chunks")
+    parser.add_argument("--topics", type=int, default=100, help="Number of synthetic topics")
+    parser.add_argument("--components", type=int, default=128, help="LSA dimensions")
+    parser.add_argument("--top_k", type=int, default=10, help="Results per query")
+    parser.add_argument("--probes", default="1,4,8,16,32", help="Comma-separated n_probe values to sweep")
+    args = parser.parse_args()
+
+    docs, queries = make_corpus(args.docs, args.topics)
+    db = SimpleVectorDB()
+    db.add_documents(docs, [f"https://example.com/{i}" for i in range(len(docs))])
+    start = time.perf_counter()
+    db.refresh()
+    print(f"tf-idf fit: {time.perf_counter() - start:.2f}s for {len(docs)} chunks")
+
+    start = time.perf_counter()
+    index = DenseVectorIndex(db, n_components=args.components).build()
+    print(f"dense build: {time.perf_counter() - start:.2f}s ({len(index.centroids)} lists)")
+
+    exact, latencies = timed_queries(db.search, queries, args.top_k)
+    p50, p99 = percentiles(latencies)
+    # Probing every list is an exhaustive scan of the LSA vectors; comparing
+    # against it separates the ANN error from the SVD approximation error.
+    exhaustive = index.search_many(queries, top_k=args.top_k, n_probe=len(index.centroids))
+
+    print(f"{'backend':<18}{'recall@k':>10}{'vs LSA':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'exact tf-idf':<18}{1.0:>10.3f}{'':>10}{p50:>10.2f}{p99:>10.2f}")
+
+    for n_probe in [int(p) for p in args.probes.split(',')] + [len(index.centroids)]:
+        found, latencies = timed_queries(lambda q, k: index.search(q, top_k=k, n_probe=n_probe), queries, args.top_k)
+        p50, p99 = percentiles(latencies)
+        print(f"{'dense nprobe=' + str(n_probe):<18}{recall_at_k(exact, found):>10.3f}"
+              f"{recall_at_k(exhaustive, found):>10.3f}{p50:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
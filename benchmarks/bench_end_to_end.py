@@ -0,0 +1,160 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.fake_llm import start_fake_llm
+from benchmarks.synthetic_site import TOPIC_WORDS, generate_site, start_site_server
+from rag_agent import RAGPipeline, TextChunker, WebScraper
+
+# Metrics where a larger value is better; counts are only reported, and every
+# other metric is a time or a size, where smaller is better.
+HIGHER_IS_BETTER = {'crawl_pages_per_sec', 'chunk_mb_per_sec', 'chunks_per_sec'}
+COUNTS = {'crawl_pages', 'chunks'}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def latency_stats(prefix, samples):
+    samples = np.asarray(samples) * 1000
+    return {f"{prefix}_p{p}_ms": float(np.percentile(samples, p)) for p in (50, 95, 99)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    metrics = {}
+    site_server, site_url = start_site_server(
+        generate_site(args.pages, args.links, paragraphs=args.paragraphs, topology=args.topology),
+        latency=args.site_latency)
+    llm_server, llm_url = start_fake_llm(first_token_delay=args.llm_first_token_delay,
+                                         token_delay=args.llm_token_delay)
+    try:
+        scraper = WebScraper(site_url, max_pages=args.pages, workers=args.workers,
+                             requests_per_second=args.rate_limit)
+        start = time.perf_counter()
+        pages = scraper.scrape()
+        elapsed = time.perf_counter() - start
+        metrics['crawl_pages'] = len(pages)
+        metrics['crawl_seconds'] = elapsed
+        metrics['crawl_pages_per_sec'] = len(pages) / elapsed
+
+        chunker = TextChunker(splitter=args.splitter, workers=args.chunk_workers)
+        total_chars = sum(len(page['text']) for page in pages)
+        start = time.perf_counter()
+        chunks = chunker.chunk_many(pages)
+        elapsed = time.perf_counter() - start
+        chunker.close()
+        metrics['chunks'] = len(chunks)
+        metrics['chunk_seconds'] = elapsed
+        metrics['chunk_mb_per_sec'] = total_chars / elapsed / 1e6
+        metrics['chunks_per_sec'] = len(chunks) / elapsed
+
+        rag_pipeline = RAGPipeline("benchmark", base_url=llm_url, max_retries=0)
+        start = time.perf_counter()
+        rag_pipeline.index_documents(chunks)
+        rag_pipeline.vector_db.refresh()
+        metrics['index_build_seconds'] = time.perf_counter() - start
+
+        rng = random.Random(1)
+        queries = [" ".join(rng.sample(TOPIC_WORDS, 4)) for _ in range(args.queries)]
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            rag_pipeline.retrieve(query, top_k=args.top_k)
+            latencies.append(time.perf_counter() - start)
+        metrics.update(latency_stats('retrieve', latencies))
+
+        latencies = []
+        failures = 0
+        for query in queries[:args.llm_queries]:
+            start = time.perf_counter()
+            response = rag_pipeline.generate(query, rag_pipeline.retrieve(query, top_k=args.top_k))
+            latencies.append(time.perf_counter() - start)
+            failures += 'error' in response
+        metrics.update(latency_stats('answer', latencies))
+        metrics['answer_failures'] = failures
+    finally:
+        site_server.shutdown()
+        llm_server.shutdown()
+
+    metrics['peak_rss_mb'] = peak_rss_mb()
+    return metrics
+
+
+def compare(baseline, current):
+    print(f"{'metric':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, value in current['metrics'].items():
+        old = baseline['metrics'].get(name)
+        if value is None or old is None:
+            continue
+        change = (value - old) / old * 100 if old else 0.0
+        better = change > 0 if name in HIGHER_IS_BETTER else change < 0
+        marker = '' if abs(change) < 5 or name in COUNTS else (' better' if better else ' worse')
+        print(f"{name:<24}{old:>12.3f}{value:>12.3f}{change:>+9.1f}%{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark: crawl, chunk, index, retrieve and "
+                                                 "answer against a synthetic site and a fake LLM")
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the synthetic site")
+    parser.add_argument("--links", type=int, default=5, help="Links per page")
+    parser.add_argument("--paragraphs", type=int, default=6, help="Paragraphs per page")
+    parser.add_argument("--topology", choices=['random', 'tree', 'chain'], default='random')
+    parser.add_argument("--site_latency", type=float, default=0.0, help="Seconds of delay per page request")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent fetch workers")
+    parser.add_argument("--rate_limit", type=float, default=1000.0, help="Requests per second per host")
+    parser.add_argument("--splitter", choices=['nltk', 'regex'], default='regex')
+    parser.add_argument("--chunk_workers", type=int, default=1, help="Processes used for chunking")
+    parser.add_argument("--queries", type=int, default=200, help="Retrieval queries to time")
+    parser.add_argument("--llm_queries", type=int, default=20, help="Queries answered through the fake LLM")
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--llm_first_token_delay", type=float, default=0.05)
+    parser.add_argument("--llm_token_delay", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare this run against")
+    args = parser.parse_args()
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': vars(args),
+        'metrics': run(args),
+    }
+    for name, value in results['metrics'].items():
+        print(f"{name:<24}{value if value is None else round(value, 3)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        compare(baseline, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import random
+import time
+
+from rag_agent import WebScraper, lxml_etree
+
+WORDS = ("crawler index vector query answer page content token model search "
+         "document retrieval context source python network cache latency").split()
+
+
+def make_page(sections, seed=0):
+    rng = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><title>Benchmark page</title>",
+             "<style>body { font-family: sans-serif; } .x { color: red; }</style>",
+             "<script>window.data = {" + ",".join(f"k{i}: {i}" for i in range(200)) + "};</script>",
+             "</head><body><header><h1>Site header</h1></header>"]
+    for i in range(sections):
+        menu = "".join(f'<li><a href="/section/{rng.randrange(1000)}">Menu {j}</a></li>' for j in range(10))
+        parts.append(f"<nav><ul>{menu}</ul></nav><section><h2>Section {i}</h2>")
+        for _ in range(5):
+            sentence = " ".join(rng.choice(WORDS) for _ in range(25))
+            parts.append(f'<p>{sentence.capitalize()}. See <a href="/page/{rng.randrange(5000)}#top">more</a> &amp; details.</p>')
+        parts.append("<script>track('section');</script></section>")
+    parts.append("<footer><p>Copyright</p></footer></body></html>")
+    return "\n".join(parts)
+
+
+def legacy_parse(scraper, html, url):
+    return scraper.extract_text(html), scraper.extract_links(html, url)
+
+
+def time_call(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTML parsing backends on large pages")
+    parser.add_argument("--sections", type=int, default=2000, help="Number of content sections per page")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions (best of N is reported)")
+    args = parser.parse_args()
+
+    url = "https://example.com/docs/"
+    html = make_page(args.sections)
+    scraper = WebScraper(url)
+
+    baseline_time, (baseline_text, baseline_links) = time_call(lambda: legacy_parse(scraper, html, url), args.repeat)
+    print(f"page size: {len(html) / 1e6:.2f} MB")
+    print(f"{'backend':<22}{'seconds':>10}{'speedup':>10}  same text  same links")
+    print(f"{'legacy (2x bs4)':<22}{baseline_time:>10.3f}{1.0:>10.2f}")
+
+    backends = ['bs4', 'stream'] + (['lxml'] if lxml_etree is not None else [])
+    for backend in backends:
+        scraper.parser = backend
+        elapsed, (text, links) = time_call(lambda: scraper.parse_page(html, url), args.repeat)
+        print(f"{backend:<22}{elapsed:>10.3f}{baseline_time / elapsed:>10.2f}  "
+              f"{str(text == baseline_text):<9}  {links == baseline_links}")
+
+    if lxml_etree is None:
+        print("lxml is not installed; skipped the lxml backend")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'import rag_agent': [sys.executable, '-c', 'import rag_agent'],
+    'cli --help': [sys.executable, 'rag_agent.py', '--help'],
+    # Outside `streamlit run` the app script executes in bare mode, which
+    # still imports everything the app needs at startup.
+    'import app': [sys.executable, '-c', 'import app'],
+}
+
+
+def cold_start(command, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        samples.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1:]
+    return statistics.median(samples), None
+
+
+def slowest_imports(module, limit):
+    # Parses `python -X importtime` output: "import time: self | cumulative | name".
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT,
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split(':', 1)[1].split('|')
+        # Nesting is shown by two extra spaces per level; keep the module and
+        # its direct imports.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time of the rag_agent module, its CLI and the app")
+    parser.add_argument("--runs", type=int, default=5, help="Subprocess runs per target (the median is reported)")
+    parser.add_argument("--cli_budget", type=float, default=0.5, help="Seconds allowed for import rag_agent and --help")
+    parser.add_argument("--app_budget", type=float, default=3.0, help="Seconds allowed for importing the app")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    budgets = {'import rag_agent': args.cli_budget, 'cli --help': args.cli_budget, 'import app': args.app_budget}
+    # A target that crashes or cannot import fails the run like one over budget.
+    failed = False
+    print(f"{'target':<20}{'median s':>10}{'budget s':>10}")
+    for name, command in TARGETS.items():
+        elapsed, error = cold_start(command, args.runs)
+        if elapsed is None:
+            print(f"{name:<20}{'failed':>10}{budgets[name]:>10.2f}  {' '.join(error)}")
+            failed = True
+            continue
+        over = elapsed > budgets[name]
+        failed |= over
+        print(f"{name:<20}{elapsed:>10.3f}{budgets[name]:>10.2f}{'  OVER BUDGET' if over else ''}")
+
+    print("\nslowest imports for `import rag_agent`:")
+    for cumulative_us, name in slowest_imports('rag_agent', args.top):
+        print(f"{name:<30}{cumulative_us / 1000:>10.1f} ms")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+
+        if server.error_rate and server.random.random() < server.error_rate:
+            status = server.random.choice([429, 500, 503])
+            self._send_json(status, {'error': {'message': 'injected failure', 'type': 'server_error', 'code': status}})
+            return
+
+        prompt = request.get('messages', [{}])[-1].get('content', '')
+        question = prompt.rsplit('QUESTION:', 1)[-1].split('ANSWER:', 1)[0].strip()
+        answer = server.answer_template.format(question=question)
+        tokens = [word + ' ' for word in answer.split()]
+
+        time.sleep(server.first_token_delay)
+        if request.get('stream'):
+            self._stream(request, tokens)
+        else:
+            time.sleep(server.token_delay * len(tokens))
+            self._send_json(200, {
+                'id': f'chatcmpl-{uuid.uuid4().hex}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(tokens).strip()},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {'prompt_tokens': len(prompt.split()), 'completion_tokens': len(tokens),
+                          'total_tokens': len(prompt.split()) + len(tokens)},
+            })
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, request, tokens):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+        deltas = [{'role': 'assistant', 'content': ''}] + [{'content': token} for token in tokens] + [{}]
+        for i, delta in enumerate(deltas):
+            if 0 < i < len(deltas) - 1:
+                time.sleep(self.server.token_delay)
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': request.get('model', 'fake'),
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': 'stop' if i == len(deltas) - 1 else None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_llm(host='127.0.0.1', port=0, first_token_delay=0.2, token_delay=0.01,
+                   answer_template="This is a canned answer about: {question}", error_rate=0.0, seed=0):
+    # Serves an OpenAI-compatible /v1/chat/completions endpoint (plain and
+    # streamed) from a daemon thread. Returns the server and its base URL.
+    server = ThreadingHTTPServer((host, port), FakeLLMHandler)
+    server.daemon_threads = True
+    server.first_token_delay = first_token_delay
+    server.token_delay = token_delay
+    server.answer_template = answer_template
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first_token_delay", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--token_delay", type=float, default=0.01, help="Seconds between tokens")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests failed with 429/5xx")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_llm(port=args.port, first_token_delay=args.first_token_delay,
+                                      token_delay=args.token_delay, error_rate=args.error_rate)
+    print(f"Fake LLM listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import numpy as np
+
+from benchmarks.fake_llm import start_fake_llm
+from benchmarks.synthetic_site import TOPIC_WORDS, generate_site, start_site_server
+from rag_agent import METRICS, RAGPipeline, TextChunker, WebScraper
+from server import QueryService, start_service
+
+
+def build_pipeline(args, llm_url):
+    site_server, site_url = start_site_server(generate_site(args.pages, paragraphs=args.paragraphs))
+    try:
+        pages = WebScraper(site_url, max_pages=args.pages, workers=8, requests_per_second=1000.0).scrape()
+    finally:
+        site_server.shutdown()
+    chunker = TextChunker(splitter='regex')
+    chunks = chunker.chunk_many(pages)
+    chunker.close()
+    rag_pipeline = RAGPipeline("benchmark", base_url=llm_url, max_retries=0)
+    rag_pipeline.index_documents(chunks)
+    rag_pipeline.vector_db.refresh()
+    return rag_pipeline
+
+
+def make_workload(args):
+    # Queries are drawn from a fixed pool with a skewed popularity, as in real
+    # traffic, so concurrent clients often ask the same question.
+    rng = random.Random(args.seed)
+    pool = [" ".join(rng.sample(TOPIC_WORDS, 4)) for _ in range(args.distinct_queries)]
+    weights = [1 / (rank + 1) for rank in range(len(pool))]
+    return [('/answer' if rng.random() < args.answer_fraction else '/retrieve', rng.choices(pool, weights)[0])
+            for _ in range(args.requests)]
+
+
+def client(base_url, requests, top_k, samples, lock):
+    url = urlparse(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+    local = []
+    for endpoint, query in requests:
+        body = json.dumps({'query': query, 'top_k': top_k})
+        start = time.perf_counter()
+        try:
+            connection.request('POST', endpoint, body, {'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port, timeout=60)
+            status = None
+        local.append((endpoint, time.perf_counter() - start, status))
+    connection.close()
+    with lock:
+        samples.extend(local)
+
+
+def metric(name, field='value'):
+    return sum(record[field] for record in METRICS.snapshot() if record['name'] == name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the query service against a fake LLM: throughput, "
+                                                 "tail latency, retrieval batching and answer coalescing")
+    parser.add_argument("--pages", type=int, default=200, help="Pages in the synthetic site that is indexed")
+    parser.add_argument("--paragraphs", type=int, default=6, help="Paragraphs per page")
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent keep-alive clients")
+    parser.add_argument("--answer_fraction", type=float, default=0.2, help="Fraction of requests sent to /answer")
+    parser.add_argument("--distinct_queries", type=int, default=50, help="Size of the query pool")
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--batch_window_ms", type=float, default=5.0)
+    parser.add_argument("--max_batch", type=int, default=64, help="Largest retrieval batch (1 disables batching)")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="Maximum concurrent LLM requests")
+    parser.add_argument("--no_coalesce", action="store_true", help="Send every /answer request to the LLM")
+    parser.add_argument("--llm_first_token_delay", type=float, default=0.2)
+    parser.add_argument("--llm_token_delay", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    llm_server, llm_url = start_fake_llm(first_token_delay=args.llm_first_token_delay,
+                                         token_delay=args.llm_token_delay)
+    service = QueryService(build_pipeline(args, llm_url), top_k=args.top_k, batch_window=args.batch_window_ms / 1000,
+                           max_batch=args.max_batch, max_in_flight=args.max_in_flight, coalesce=not args.no_coalesce)
+    service_thread, base_url = start_service(service)
+    workload = make_workload(args)
+    METRICS.reset()
+
+    samples = []
+    lock = threading.Lock()
+    clients = [threading.Thread(target=client,
+                                args=(base_url, workload[i::args.concurrency], args.top_k, samples, lock))
+               for i in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    service_thread.shutdown()
+    service.close()
+    llm_server.shutdown()
+
+    by_endpoint = defaultdict(list)
+    failures = 0
+    for endpoint, latency, status in samples:
+        by_endpoint[endpoint].append(latency)
+        failures += status != 200
+    results = {
+        'requests': len(samples),
+        'seconds': elapsed,
+        'requests_per_sec': len(samples) / elapsed,
+        'failures': failures,
+        'llm_calls': llm_server.request_count,
+        'answers_coalesced': metric('server_answer_coalesced_total'),
+        'mean_retrieve_batch': metric('server_retrieve_batch_size', 'sum') /
+                               max(1, metric('server_retrieve_batch_size', 'count')),
+    }
+    for endpoint, latencies in sorted(by_endpoint.items()):
+        latencies = np.asarray(latencies) * 1000
+        results[f"{endpoint.strip('/')}_requests"] = len(latencies)
+        results.update({f"{endpoint.strip('/')}_p{p}_ms": float(np.percentile(latencies, p)) for p in (50, 95, 99)})
+
+    for name, value in results.items():
+        print(f"{name:<24}{round(value, 3)}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'params': vars(args), 'metrics': results}, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
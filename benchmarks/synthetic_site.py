@@ -0,0 +1,102 @@
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOPIC_WORDS = ("index crawler page query model answer token vector chunk source context latency cache network "
+               "parser document retrieval score cluster shard replica storage memory thread process queue "
+               "stream batch budget metric server client request response header cookie session").split()
+
+BOILERPLATE = ("Copyright Example Corp. All rights reserved. Use of this site is subject to the terms of "
+               "service and the privacy policy.")
+
+
+def make_paragraph(rng, sentences):
+    parts = []
+    for _ in range(sentences):
+        sentence = " ".join(rng.choice(TOPIC_WORDS) for _ in range(rng.randint(6, 24)))
+        parts.append(sentence.capitalize() + rng.choice(".!?."))
+    return " ".join(parts)
+
+
+def page_links(i, n_pages, links_per_page, topology, rng):
+    if topology == 'chain':
+        return [i + 1] if i + 1 < n_pages else []
+    if topology == 'tree':
+        return [child for child in range(i * links_per_page + 1, (i + 1) * links_per_page + 1) if child < n_pages]
+    # 'random': a link to the next page keeps every page reachable, the rest
+    # are random so the crawl frontier fans out.
+    links = [i + 1] if i + 1 < n_pages else []
+    links += rng.sample(range(n_pages), min(n_pages, max(0, links_per_page - len(links))))
+    return links
+
+
+def generate_site(n_pages=200, links_per_page=5, paragraphs=6, sentences=8, topology='random', seed=0):
+    # Returns {path: html} for a site rooted at '/', with pages at /page/<i>.
+    rng = random.Random(seed)
+    pages = {}
+    for i in range(n_pages):
+        path = '/' if i == 0 else f'/page/{i}'
+        links = "".join(f'<li><a href="{"/" if j == 0 else f"/page/{j}"}">Page {j}</a></li>'
+                        for j in page_links(i, n_pages, links_per_page, topology, rng))
+        body = "".join(f"<p>{make_paragraph(rng, sentences)}</p>" for _ in range(paragraphs))
+        pages[path] = (f"<!DOCTYPE html><html><head><title>Page {i}</title><style>p {{margin: 0}}</style></head>"
+                       f"<body><header><nav><ul>{links}</ul></nav></header><main><h1>Page {i}</h1>{body}</main>"
+                       f"<footer><p>{BOILERPLATE}</p></footer><script>var page = {i};</script></body></html>")
+    return pages
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.pages.get(self.path.split('?', 1)[0].split('#', 1)[0])
+        if body is None:
+            self.send_error(404)
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_site_server(pages, host='127.0.0.1', port=0, latency=0.0):
+    # Serves the pages from generate_site on a daemon thread, with an optional
+    # per-request delay to mimic a remote host. Returns the server and its URL.
+    server = ThreadingHTTPServer((host, port), SiteHandler)
+    server.daemon_threads = True
+    server.pages = pages
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic website for crawl benchmarks")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages")
+    parser.add_argument("--links", type=int, default=5, help="Links per page")
+    parser.add_argument("--topology", choices=['random', 'tree', 'chain'], default='random')
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of delay per request")
+    args = parser.parse_args()
+
+    pages = generate_site(args.pages, args.links, topology=args.topology)
+    server, base_url = start_site_server(pages, port=args.port, latency=args.latency)
+    print(f"Synthetic site with {len(pages)} pages at {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,1179 @@
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin, urlparse, urlunparse
 import numpy as np
-from openai import OpenAI
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import nltk
-from nltk.tokenize import sent_tokenize
 import time
 import logging
+import contextlib
+import functools
+import hashlib
+import heapq
+import itertools
+import json
+import mmap
+import os
+import random
+import re
+import shutil
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+class MetricsRegistry:
+    # Thread-safe counters, gauges and histograms keyed by name and labels,
+    # exportable as JSON or in the Prometheus text format. The pipeline
+    # components all record into the module-level METRICS registry.
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 
-class SimpleVectorDB:
     def __init__(self):
-        self.documents = []
-        self.urls = []
-        self.vectorizer = TfidfVectorizer(stop_words='english')
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, buckets=None, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                bounds = tuple(buckets or self.DEFAULT_BUCKETS)
+                histogram = self._histograms[key] = {'bounds': bounds, 'counts': [0] * len(bounds),
+                                                     'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(histogram['bounds']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+            histogram['count'] += 1
+            histogram['sum'] += value
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        # One record per series, e.g. {'name', 'type', 'labels', 'value'}; histograms
+        # carry count, sum and cumulative bucket counts instead of a value.
+        with self._lock:
+            records = [{'name': name, 'type': 'counter', 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in self._counters.items()]
+            records += [{'name': name, 'type': 'gauge', 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in self._gauges.items()]
+            for (name, labels), histogram in self._histograms.items():
+                records.append({
+                    'name': name,
+                    'type': 'histogram',
+                    'labels': dict(labels),
+                    'count': histogram['count'],
+                    'sum': histogram['sum'],
+                    'buckets': dict(zip(histogram['bounds'], itertools.accumulate(histogram['counts'])))
+                })
+        return sorted(records, key=lambda record: (record['name'], sorted(record['labels'].items())))
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self):
+        def series(name, labels, extra=None):
+            items = list(labels.items()) + ([extra] if extra else [])
+            if not items:
+                return name
+            return name + '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+        lines = []
+        typed = set()
+        for record in self.snapshot():
+            name, labels = record['name'], record['labels']
+            if name not in typed:
+                lines.append(f"# TYPE {name} {record['type']}")
+                typed.add(name)
+            if record['type'] != 'histogram':
+                lines.append(f"{series(name, labels)} {record['value']}")
+                continue
+            for bound, count in record['buckets'].items():
+                lines.append(f"{series(name + '_bucket', labels, ('le', bound))} {count}")
+            lines.append(f"{series(name + '_bucket', labels, ('le', '+Inf'))} {record['count']}")
+            lines.append(f"{series(name + '_sum', labels)} {record['sum']}")
+            lines.append(f"{series(name + '_count', labels)} {record['count']}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = MetricsRegistry()
+
+class MappedTexts:
+    # Read-only sequence of UTF-8 strings stored back to back in one file and
+    # decoded on access from a memory map.
+    def __init__(self, path, offsets):
+        self.offsets = offsets
+        self._buffer = b''
+        if len(offsets) > 1 and offsets[-1] > 0:
+            with open(path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("text index out of range")
+        return self._buffer[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+def _save_csr(path, prefix, matrix):
+    np.save(os.path.join(path, f'{prefix}_data.npy'), matrix.data)
+    np.save(os.path.join(path, f'{prefix}_indices.npy'), matrix.indices)
+    np.save(os.path.join(path, f'{prefix}_indptr.npy'), matrix.indptr)
+
+def _load_csr(path, prefix, shape, mmap_mode):
+    from scipy import sparse as sp
+
+    arrays = [np.load(os.path.join(path, f'{prefix}_{name}.npy'), mmap_mode=mmap_mode)
+              for name in ('data', 'indices', 'indptr')]
+    return sp.csr_matrix(tuple(arrays), shape=tuple(shape), copy=False)
+
+class ChunkStore:
+    # Chunks as (page_id, start, end) character offsets into page texts that
+    # are stored once, so overlapping chunks share their text. URLs are
+    # interned in a table and referenced by id; chunk text is only sliced out
+    # when it is asked for.
+    def __init__(self):
+        self.pages = []
+        self.url_table = []
+        self._url_ids = {}
+        self._page_urls = np.zeros(16, dtype=np.int32)
+        self._page_ids = np.zeros(16, dtype=np.int32)
+        self._starts = np.zeros(16, dtype=np.int32)
+        self._ends = np.zeros(16, dtype=np.int32)
+        self.size = 0
+        self._recent_page = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def page_urls(self):
+        return self._page_urls[:len(self.pages)]
+
+    @property
+    def page_ids(self):
+        return self._page_ids[:self.size]
+
+    @property
+    def starts(self):
+        return self._starts[:self.size]
+
+    @property
+    def ends(self):
+        return self._ends[:self.size]
+
+    @staticmethod
+    def _grow(array, needed):
+        if needed <= len(array):
+            return array
+        grown = np.zeros(max(needed, 2 * len(array)), dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def intern_url(self, url):
+        url_id = self._url_ids.get(url)
+        if url_id is None:
+            url_id = self._url_ids[url] = len(self.url_table)
+            self.url_table.append(url)
+        return url_id
+
+    def add_page(self, text, url):
+        # Consecutive chunks of the same page object reuse its entry.
+        if self._recent_page is not None and self._recent_page[0] is text and self._recent_page[1] == url:
+            return self._recent_page[2]
+        if not isinstance(self.pages, list):
+            self.pages = list(self.pages)
+        page_id = len(self.pages)
+        self._page_urls = self._grow(self._page_urls, page_id + 1)
+        self._page_urls[page_id] = self.intern_url(url)
+        self.pages.append(text)
+        self._recent_page = (text, url, page_id)
+        return page_id
+
+    def add_chunk(self, page_id, start, end):
+        i = self.size
+        self._page_ids = self._grow(self._page_ids, i + 1)
+        self._starts = self._grow(self._starts, i + 1)
+        self._ends = self._grow(self._ends, i + 1)
+        self._page_ids[i] = page_id
+        self._starts[i] = start
+        self._ends[i] = end
+        self.size += 1
+
+    def move_chunk(self, i, url):
+        # Gives chunk i a page of its own under another URL, so it outlives
+        # the page it was cut from.
+        text = self.text(i)
+        page_id = self.add_page(text, url)
+        self._page_ids[i] = page_id
+        self._starts[i] = 0
+        self._ends[i] = len(text)
+
+    def text(self, i):
+        return self.pages[self._page_ids[i]][self._starts[i]:self._ends[i]]
+
+    def url(self, i):
+        return self.url_table[self._page_urls[self._page_ids[i]]]
+
+    def url_ids(self, urls):
+        return [self._url_ids[url] for url in urls if url in self._url_ids]
+
+    def chunk_url_ids(self):
+        return self.page_urls[self.page_ids]
+
+    def compact(self, keep):
+        # Keeps the chunks at the given indexes and the pages they refer to.
+        page_ids = self.page_ids[keep]
+        live_pages = np.unique(page_ids)
+        remap = np.full(len(self.pages), -1, dtype=np.int32)
+        remap[live_pages] = np.arange(len(live_pages), dtype=np.int32)
+
+        self._page_urls = self.page_urls[live_pages].copy()
+        self.pages = [self.pages[i] for i in live_pages]
+        self._page_ids = remap[page_ids]
+        self._starts = self.starts[keep].copy()
+        self._ends = self.ends[keep].copy()
+        self.size = len(keep)
+        self._recent_page = None
+
+    def nbytes(self):
+        # Approximate memory held: page texts, offset arrays and the URL table.
+        texts = sum(len(page) for page in self.pages) if isinstance(self.pages, list) else 0
+        arrays = self._page_urls.nbytes + self._page_ids.nbytes + self._starts.nbytes + self._ends.nbytes
+        return texts + arrays + sum(len(url) for url in self.url_table)
+
+    def save(self, path):
+        encoded = [page.encode('utf-8') for page in self.pages]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(page) for page in encoded], out=offsets[1:])
+        with open(os.path.join(path, 'pages.bin'), 'wb') as f:
+            f.write(b''.join(encoded))
+        np.save(os.path.join(path, 'page_offsets.npy'), offsets)
+        np.save(os.path.join(path, 'page_urls.npy'), self.page_urls)
+        np.save(os.path.join(path, 'chunk_pages.npy'), self.page_ids)
+        np.save(os.path.join(path, 'chunk_starts.npy'), self.starts)
+        np.save(os.path.join(path, 'chunk_ends.npy'), self.ends)
+        return {'url_table': self.url_table}
+
+    @classmethod
+    def load(cls, path, meta, mmap_mode='r'):
+        store = cls()
+        offsets = np.load(os.path.join(path, 'page_offsets.npy'), mmap_mode=mmap_mode)
+        store.pages = MappedTexts(os.path.join(path, 'pages.bin'), offsets)
+        store.url_table = meta['url_table']
+        store._url_ids = {url: i for i, url in enumerate(store.url_table)}
+        store._page_urls = np.load(os.path.join(path, 'page_urls.npy'))
+        store._page_ids = np.load(os.path.join(path, 'chunk_pages.npy'))
+        store._starts = np.load(os.path.join(path, 'chunk_starts.npy'))
+        store._ends = np.load(os.path.join(path, 'chunk_ends.npy'))
+        store.size = len(store._page_ids)
+        return store
+
+class ChunkView:
+    # Read-only sequence over a ChunkStore, e.g. of chunk texts or URLs.
+    def __init__(self, store, getter):
+        self.store = store
+        self.getter = getter
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        return self.getter(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.getter(i)
+
+class SimpleVectorDB:
+    INDEX_VERSION = 2
+    SEARCH_BLOCK_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, incremental=False, vocabulary=None, n_features=None, auto_refresh=True):
+        from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+
+        self.store = ChunkStore()
+        # Every URL a deduplicated chunk was found on, by chunk index. The
+        # lists are shared with the deduplicator so later duplicates show up.
+        self.sources = {}
+        self.incremental = incremental
+        self.auto_refresh = auto_refresh
         self.vectors = None
-        
+        self._stale = False
+
+        if not incremental:
+            self.vectorizer = TfidfVectorizer(stop_words='english')
+            return
+
+        # New chunks are counted against a fixed vocabulary (or hashed feature
+        # space) so existing rows never need to be re-vectorized.
+        if vocabulary is not None:
+            self.vectorizer = CountVectorizer(stop_words='english', vocabulary=vocabulary)
+        else:
+            self.vectorizer = HashingVectorizer(stop_words='english', n_features=n_features or 2 ** 20,
+                                                alternate_sign=False, norm=None)
+        self._counts = None
+        self._df = None
+        self._idf = None
+
+    @property
+    def documents(self):
+        return ChunkView(self.store, self.store.text)
+
+    @property
+    def urls(self):
+        return ChunkView(self.store, self.store.url)
+
     def add_document(self, text, url):
-        self.documents.append(text)
-        self.urls.append(url)
-        self.vectors = self.vectorizer.fit_transform(self.documents)
-        
+        self.add_documents([text], [url])
+
+    def add_documents(self, texts, urls, sources=None):
+        # Each text is stored as its own page; add_chunks shares page texts.
+        texts = list(texts)
+        urls = list(urls)
+        sources = list(sources) if sources is not None else [None] * len(texts)
+        if not len(texts) == len(urls) == len(sources):
+            raise ValueError("texts, urls and sources must have the same length")
+        self.add_chunks([{'text': text, 'url': url, 'urls': source} for text, url, source in zip(texts, urls, sources)])
+
+    def add_chunks(self, chunks):
+        # Chunks from TextChunker carry their page text and offsets, so the
+        # page is stored once and each chunk costs three integers.
+        chunks = list(chunks)
+        if not chunks:
+            return
+
+        for chunk in chunks:
+            if chunk.get('page') is not None:
+                page_id = self.store.add_page(chunk['page'], chunk['url'])
+                self.store.add_chunk(page_id, chunk['start'], chunk['end'])
+            else:
+                page_id = self.store.add_page(chunk['text'], chunk['url'])
+                self.store.add_chunk(page_id, 0, len(chunk['text']))
+            if chunk.get('urls'):
+                self.sources[len(self.store) - 1] = chunk['urls']
+
+        if self.incremental:
+            self._append_counts(self._count([chunk['text'] for chunk in chunks]))
+        self._stale = True
+
+    def detach_urls(self, urls):
+        # Takes the URLs out of every chunk's source list. A list left empty
+        # means no live page has that chunk any more, and the deduplicator
+        # sharing the list stops matching new chunks against it.
+        urls = set(urls)
+        for sources in self.sources.values():
+            if not urls.isdisjoint(sources):
+                sources[:] = [url for url in sources if url not in urls]
+
+    def remove_urls(self, urls, detach=True):
+        # Drops the chunks cut from pages at these URLs. A deduplicated chunk
+        # that other pages still list as sources is kept and moved under the
+        # first of them. Pass detach=False when detach_urls already ran.
+        if detach:
+            self.detach_urls(urls)
+        total = len(self.store)
+        removed = np.isin(self.store.chunk_url_ids(), self.store.url_ids(urls))
+        for i in np.flatnonzero(removed):
+            sources = self.sources.get(int(i))
+            if sources:
+                self.store.move_chunk(int(i), sources[0])
+                removed[i] = False
+        keep = np.flatnonzero(~removed)
+        if len(keep) == total:
+            return 0
+
+        self.store.compact(keep)
+        new_index = np.full(total, -1)
+        new_index[keep] = np.arange(len(keep))
+        self.sources = {int(new_index[i]): urls for i, urls in self.sources.items() if new_index[i] >= 0}
+
+        if self.incremental and self._counts is not None:
+            removed = np.setdiff1d(np.arange(total), keep)
+            self._df -= np.bincount(self._counts[removed].indices, minlength=self._counts.shape[1])
+            self._counts = self._counts[keep]
+        if self.vectors is not None:
+            self.vectors = self.vectors[keep] if self.vectors.shape[0] == total else None
+        self._stale = True
+        return total - len(keep)
+
+    def refresh(self):
+        with METRICS.timer('vector_db_fit_seconds', incremental=self.incremental):
+            self._refit()
+        self._stale = False
+        self._record_size()
+
+    def _record_size(self):
+        METRICS.set('vector_db_documents', len(self.store))
+        METRICS.set('vector_db_store_bytes', self.store.nbytes())
+        if self.vectors is not None:
+            METRICS.set('vector_db_nnz', self.vectors.nnz)
+            METRICS.set('vector_db_matrix_bytes',
+                        self.vectors.data.nbytes + self.vectors.indices.nbytes + self.vectors.indptr.nbytes)
+
+    def _refit(self):
+        if not self.incremental:
+            if len(self.store):
+                # A loaded index pins the saved vocabulary; refitting learns a new one.
+                self.vectorizer.set_params(vocabulary=None)
+                self.vectors = self.vectorizer.fit_transform(self.documents)
+        elif self._counts is not None:
+            self._idf = self._compute_idf()
+            self.vectors = self._weight(self._counts)
+
+    def _count(self, texts):
+        return self.vectorizer.transform(texts).tocsr()
+
+    def _append_counts(self, counts):
+        from scipy import sparse as sp
+
+        counts.sum_duplicates()
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+
+        if self._counts is None:
+            self._counts = counts
+            self._df = df
+        else:
+            self._counts = sp.vstack([self._counts, counts], format='csr')
+            self._df += df
+
+        if self.auto_refresh or self._idf is None:
+            return
+
+        # On-demand mode: weight the new rows with the current IDF so they are
+        # searchable immediately; refresh() re-weights everything later.
+        self.vectors = sp.vstack([self.vectors, self._weight(counts)], format='csr')
+
+    def _compute_idf(self):
+        n_docs = self._counts.shape[0]
+        return np.log((1 + n_docs) / (1 + self._df)) + 1.0
+
+    def _weight(self, counts):
+        from scipy import sparse as sp
+        from sklearn.preprocessing import normalize
+
+        weighted = counts @ sp.diags(self._idf)
+        return normalize(weighted.tocsr(), norm='l2', copy=False)
+
+    def _transform(self, texts):
+        with METRICS.timer('vector_db_transform_seconds'):
+            if not self.incremental:
+                return self.vectorizer.transform(texts)
+            return self._weight(self._count(texts))
+
+    def save(self, path):
+        # A loaded index memory-maps the very files a save replaces, so they
+        # are written to a temporary directory first and then moved over the
+        # old ones, index.json last. Other files in the directory are kept.
+        if self._stale or self.vectors is None:
+            self.refresh()
+        os.makedirs(path, exist_ok=True)
+        tmp_path = os.path.join(path, f'.tmp-{os.getpid()}')
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        try:
+            self._write(tmp_path)
+            for name in sorted(os.listdir(tmp_path), key=lambda name: name == 'index.json'):
+                os.replace(os.path.join(tmp_path, name), os.path.join(path, name))
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def _write(self, path):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        os.makedirs(path)
+
+        meta = {
+            'version': self.INDEX_VERSION,
+            'incremental': self.incremental,
+            'auto_refresh': self.auto_refresh,
+            'sources': {i: urls for i, urls in self.sources.items() if len(urls) > 1},
+            'vectors_shape': None,
+        }
+        meta.update(self.store.save(path))
+        if self.vectors is not None:
+            vectors = self.vectors.tocsr()
+            _save_csr(path, 'vectors', vectors)
+            meta['vectors_shape'] = list(vectors.shape)
+
+        if isinstance(self.vectorizer, HashingVectorizer):
+            meta['n_features'] = self.vectorizer.n_features
+        else:
+            vocabulary = getattr(self.vectorizer, 'vocabulary_', None) or self.vectorizer.vocabulary
+            if vocabulary is not None:
+                if not isinstance(vocabulary, dict):
+                    vocabulary = {term: i for i, term in enumerate(vocabulary)}
+                meta['vocabulary'] = sorted(vocabulary, key=vocabulary.get)
+
+        if not self.incremental:
+            if self.vectors is not None:
+                np.save(os.path.join(path, 'idf.npy'), self.vectorizer.idf_)
+        elif self._counts is not None:
+            _save_csr(path, 'counts', self._counts)
+            meta['counts_shape'] = list(self._counts.shape)
+            np.save(os.path.join(path, 'df.npy'), self._df)
+            np.save(os.path.join(path, 'idf.npy'), self._idf)
+
+        with open(os.path.join(path, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(os.path.join(path, 'index.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('version') != cls.INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}: {meta.get('version')} (rebuild the index)")
+
+        vocabulary = meta.get('vocabulary')
+        if vocabulary is not None:
+            vocabulary = {term: i for i, term in enumerate(vocabulary)}
+        db = cls(incremental=meta['incremental'], vocabulary=vocabulary if meta['incremental'] else None,
+                 n_features=meta.get('n_features'), auto_refresh=meta['auto_refresh'])
+
+        db.store = ChunkStore.load(path, meta, mmap_mode)
+        db.sources = {int(i): urls for i, urls in meta.get('sources', {}).items()}
+
+        if meta['vectors_shape'] is not None:
+            db.vectors = _load_csr(path, 'vectors', meta['vectors_shape'], mmap_mode)
+            if not db.incremental:
+                db.vectorizer.set_params(vocabulary=vocabulary)
+                db.vectorizer.idf_ = np.load(os.path.join(path, 'idf.npy'))
+
+        if db.incremental and 'counts_shape' in meta:
+            db._counts = _load_csr(path, 'counts', meta['counts_shape'], mmap_mode)
+            db._df = np.load(os.path.join(path, 'df.npy'))
+            db._idf = np.load(os.path.join(path, 'idf.npy'))
+        return db
+
+    def _result(self, i, score):
+        result = {
+            'text': self.store.text(i),
+            'url': self.store.url(i),
+            'score': float(score)
+        }
+        sources = self.sources.get(i)
+        if sources and len(sources) > 1:
+            result['sources'] = list(sources)
+        return result
+
     def search(self, query, top_k=3):
-        if not self.documents:
-            return []
-            
-        query_vector = self.vectorizer.transform([query])
-        similarities = cosine_similarity(query_vector, self.vectors).flatten()
-        indices = np.argsort(similarities)[-top_k:][::-1]
-        
+        return self.search_many([query], top_k=top_k)[0]
+
+    def search_many(self, queries, top_k=3, block_size=None):
+        queries = list(queries)
+        if not len(self.store) or not queries or top_k <= 0:
+            return [[] for _ in queries]
+
+        if self._stale and (self.auto_refresh or self.vectors is None):
+            self.refresh()
+        if self.vectors is None:
+            return [[] for _ in queries]
+
+        n_docs = self.vectors.shape[0]
+        k = min(top_k, n_docs)
+        if block_size is None:
+            block_size = max(1, self.SEARCH_BLOCK_BYTES // (8 * n_docs))
+
+        start_time = time.perf_counter()
+        # Rows are L2-normalised, so the sparse dot product is the cosine similarity.
+        query_vectors = self._transform(queries)
+        vectors_t = self.vectors.T.tocsc()
         results = []
-        for i in indices:
-            if similarities[i] > 0.0:
-                results.append({
-                    'text': self.documents[i],
-                    'url': self.urls[i],
-                    'score': float(similarities[i])
-                })
-        
+        for start in range(0, len(queries), block_size):
+            similarities = (query_vectors[start:start + block_size] @ vectors_t).toarray()
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(similarities, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            for indices, scores in zip(top, top_scores):
+                results.append([self._result(i, score) for i, score in zip(indices, scores) if score > 0.0])
+
+        METRICS.observe('vector_db_search_seconds', time.perf_counter() - start_time)
+        METRICS.inc('vector_db_queries_total', len(queries))
         return results
 
+class DenseVectorIndex:
+    # LSA vectors (truncated SVD of the TF-IDF matrix) in an inverted-file
+    # index: vectors are grouped by their nearest k-means centroid and a
+    # query only scores the n_probe closest lists.
+    def __init__(self, vector_db, n_components=128, n_lists=None, n_probe=8, random_state=0):
+        self.vector_db = vector_db
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.components = None
+
+    def build(self):
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.preprocessing import normalize
+
+        db = self.vector_db
+        if db._stale or db.vectors is None:
+            db.refresh()
+        if db.vectors is None or db.vectors.shape[0] < 2:
+            raise ValueError("DenseVectorIndex needs at least two indexed documents")
+
+        # Only terms that occur in the corpus can contribute, which keeps the
+        # projection small even for hashed feature spaces.
+        vectors = db.vectors.tocsc()
+        self.active_terms = np.flatnonzero(np.diff(vectors.indptr))
+        vectors = vectors[:, self.active_terms].tocsr()
+
+        n_components = max(1, min(self.n_components, vectors.shape[1] - 1, vectors.shape[0] - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        dense = normalize(svd.fit_transform(vectors)).astype(np.float32)
+        self.components = svd.components_.astype(np.float32)
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(dense.shape[0])))
+        n_lists = min(n_lists, dense.shape[0])
+        kmeans = MiniBatchKMeans(n_clusters=n_lists, random_state=self.random_state, n_init=3,
+                                 batch_size=min(1024, dense.shape[0]))
+        assignments = kmeans.fit_predict(dense)
+        self.centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+        order = np.argsort(assignments, kind='stable')
+        self.ids = order
+        self.vectors = dense[order]
+        self.list_offsets = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        logger.info(f"Built dense index: {dense.shape[0]} vectors, {n_components} dims, {n_lists} lists")
+        return self
+
+    def _embed(self, queries):
+        from sklearn.preprocessing import normalize
+
+        sparse = self.vector_db._transform(queries).tocsc()[:, self.active_terms]
+        return normalize(np.asarray(sparse @ self.components.T, dtype=np.float32))
+
+    def search(self, query, top_k=3, n_probe=None):
+        return self.search_many([query], top_k=top_k, n_probe=n_probe)[0]
+
+    def search_many(self, queries, top_k=3, n_probe=None):
+        queries = list(queries)
+        if self.components is None:
+            self.build()
+
+        n_lists = len(self.centroids)
+        n_probe = min(n_probe or self.n_probe, n_lists)
+        embedded = self._embed(queries)
+        centroid_scores = embedded @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+
+        results = []
+        for query_vector, lists in zip(embedded, probes):
+            rows = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+            if not len(rows) or not query_vector.any():
+                results.append([])
+                continue
+
+            scores = self.vectors[rows] @ query_vector
+            k = min(top_k, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            results.append([self.vector_db._result(self.ids[rows[i]], scores[i]) for i in top if scores[i] > 0.0])
+
+        return results
+
+class ShardedIndex:
+    # A directory of independently built and saved SimpleVectorDB shards (one
+    # per site, say) listed in manifest.json. Queries fan out to all shards on
+    # a thread pool and the per-shard top-k lists are merged on their cosine
+    # scores, which share one scale across shards. Each result names its shard.
+    MANIFEST_VERSION = 1
+
+    def __init__(self, path, workers=4, mmap_mode='r'):
+        self.path = path
+        self.workers = workers
+        self.mmap_mode = mmap_mode
+        self.lock = threading.Lock()
+        self.shards = {}
+        self._pool = None
+        os.makedirs(path, exist_ok=True)
+
+        manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get('version') != self.MANIFEST_VERSION:
+                raise ValueError(f"Unsupported shard manifest version in {path}: {self.manifest.get('version')}")
+        else:
+            self.manifest = {'version': self.MANIFEST_VERSION, 'shards': {}}
+        for name, info in self.manifest['shards'].items():
+            self.shards[name] = SimpleVectorDB.load(os.path.join(path, info['path']), mmap_mode)
+
+    def shard_path(self, name):
+        info = self.manifest['shards'].get(name)
+        return os.path.join(self.path, info['path']) if info else None
+
+    def _write_manifest(self):
+        manifest_path = os.path.join(self.path, 'manifest.json')
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def add_shard(self, name, vector_db, base_url=None):
+        # Adds or rebuilds one shard. It is saved to a new directory and the
+        # manifest is switched over atomically, so readers never see a
+        # half-written shard; the other shards are untouched.
+        with self.lock:
+            old = self.manifest['shards'].get(name)
+            generation = old['generation'] + 1 if old else 0
+            directory = f"{re.sub(r'[^A-Za-z0-9._-]+', '_', name)}-{generation}"
+            vector_db.save(os.path.join(self.path, directory))
+            self.manifest['shards'][name] = {
+                'path': directory,
+                'generation': generation,
+                'base_url': base_url,
+                'documents': len(vector_db.store),
+                'updated': time.time()
+            }
+            self._write_manifest()
+            self.shards[name] = SimpleVectorDB.load(os.path.join(self.path, directory), self.mmap_mode)
+        if old:
+            shutil.rmtree(os.path.join(self.path, old['path']), ignore_errors=True)
+        logger.info(f"Saved shard {name} with {len(vector_db.store)} documents")
+
+    def remove_shard(self, name):
+        with self.lock:
+            if name not in self.shards:
+                raise ValueError(f"No shard named {name} in {self.path}")
+            info = self.manifest['shards'].pop(name)
+            self._write_manifest()
+            del self.shards[name]
+        shutil.rmtree(os.path.join(self.path, info['path']), ignore_errors=True)
+        logger.info(f"Removed shard {name}")
+
+    def search(self, query, top_k=3):
+        return self.search_many([query], top_k=top_k)[0]
+
+    def search_many(self, queries, top_k=3):
+        queries = list(queries)
+        with self.lock:
+            shards = list(self.shards.items())
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=max(1, self.workers))
+        if not shards:
+            return [[] for _ in queries]
+
+        def search_shard(shard):
+            name, vector_db = shard
+            return name, vector_db.search_many(queries, top_k=top_k)
+
+        merged = [[] for _ in queries]
+        for name, results in self._pool.map(search_shard, shards):
+            for docs, into in zip(results, merged):
+                for doc in docs:
+                    doc['shard'] = name
+                into.extend(docs)
+        return [heapq.nlargest(top_k, docs, key=lambda doc: doc['score']) for docs in merged]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+SKIPPED_TAGS = frozenset(['script', 'style', 'header', 'footer', 'nav'])
+
+def clean_text(text):
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+class PageTextTarget:
+    # Parser target shared by the streaming backends: collects visible text and
+    # hrefs in one pass and drops SKIPPED_TAGS subtrees instead of building a tree.
+    def __init__(self):
+        self.parts = []
+        self.hrefs = []
+        self.skip_depth = 0
+
+    def start(self, tag, attrs):
+        if tag == 'a':
+            href = attrs.get('href')
+            if href is not None:
+                self.hrefs.append(href)
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return ''.join(self.parts), self.hrefs
+
+class StreamingHTMLParser(HTMLParser):
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag, {name: value or '' for name, value in attrs})
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+    def close(self):
+        super().close()
+        return self.target.close()
+
+def parse_html(html, backend='auto'):
+    if backend == 'auto':
+        backend = 'lxml' if lxml_etree is not None else 'stream'
+
+    if backend == 'lxml':
+        if lxml_etree is None:
+            raise ImportError("The 'lxml' parser backend requires the lxml package")
+        parser = lxml_etree.HTMLParser(target=PageTextTarget())
+        parser.feed(html)
+        text, hrefs = parser.close()
+    elif backend == 'stream':
+        parser = StreamingHTMLParser(PageTextTarget())
+        parser.feed(html)
+        text, hrefs = parser.close()
+    elif backend == 'bs4':
+        from bs4 import BeautifulSoup
+
+        soup = BeautifulSoup(html, 'html.parser')
+        hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+        for element in soup(list(SKIPPED_TAGS)):
+            element.decompose()
+        text = soup.get_text()
+    else:
+        raise ValueError(f"Unknown HTML parser backend: {backend}")
+
+    return clean_text(text), hrefs
+
+TRACKING_PARAMS = frozenset(['fbclid', 'gclid', 'dclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'yclid'])
+
+HTML_MEDIA_TYPES = frozenset(['text/html', 'application/xhtml+xml'])
+
+NON_HTML_EXTENSIONS = ('.pdf', '.zip', '.gz', '.tar', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico',
+                       '.mp3', '.mp4', '.avi', '.mov', '.css', '.js', '.json', '.xml', '.doc', '.docx',
+                       '.xls', '.xlsx', '.ppt', '.pptx', '.exe', '.dmg', '.woff', '.woff2', '.ttf')
+
+def canonicalize_url(url):
+    # One spelling per page: no fragment, lowercase scheme and host, no
+    # default port, no trailing slash (except the root), tracking parameters
+    # (utm_* and click ids) removed and the rest sorted.
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme, netloc.rpartition(':')[2]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rpartition(':')[0]
+    path = (parsed.path.rstrip('/') or '/') if netloc else parsed.path
+    query = '&'.join(sorted(param for param in parsed.query.split('&') if param and
+                            not param.split('=', 1)[0].lower().startswith('utm_') and
+                            param.split('=', 1)[0].lower() not in TRACKING_PARAMS))
+    return urlunparse((scheme, netloc, path, parsed.params, query, ''))
+
+class PageCache:
+    # On-disk cache of fetched pages keyed by canonical URL. Each entry is a
+    # JSON metadata file (validators, content hash, extracted text and links)
+    # next to the raw body; least recently used entries are evicted once the
+    # cache grows past max_bytes.
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self._sizes = {}
+        for name in os.listdir(path):
+            key, ext = os.path.splitext(name)
+            if ext in ('.json', '.html'):
+                self._sizes[key] = self._sizes.get(key, 0) + os.path.getsize(os.path.join(path, name))
+        self.total_bytes = sum(self._sizes.values())
+
+    def _key(self, url):
+        return hashlib.sha256(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+    def _files(self, key):
+        return os.path.join(self.path, key + '.json'), os.path.join(self.path, key + '.html')
+
+    def get(self, url):
+        meta_path, _ = self._files(self._key(url))
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(meta_path)
+        return entry
+
+    def put(self, url, body, text, links, etag=None, last_modified=None, content_hash=None):
+        key = self._key(url)
+        meta_path, body_path = self._files(key)
+        entry = {
+            'url': canonicalize_url(url),
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash or hashlib.sha256(body).hexdigest(),
+            'text': text,
+            'links': links,
+        }
+        with open(body_path, 'wb') as f:
+            f.write(body)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+
+        with self.lock:
+            size = os.path.getsize(meta_path) + len(body)
+            self.total_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            if self.total_bytes > self.max_bytes:
+                self._evict(keep=key)
+        return entry
+
+    def update_validators(self, url, entry, etag=None, last_modified=None):
+        if etag == entry.get('etag') and last_modified == entry.get('last_modified'):
+            return
+        entry = dict(entry, etag=etag, last_modified=last_modified)
+        meta_path, _ = self._files(self._key(url))
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+
+    def _evict(self, keep):
+        by_age = []
+        for key in self._sizes:
+            if key != keep:
+                try:
+                    by_age.append((os.path.getmtime(self._files(key)[0]), key))
+                except OSError:
+                    by_age.append((0, key))
+        by_age.sort()
+
+        for _, key in by_age:
+            if self.total_bytes <= self.max_bytes:
+                break
+            for file_path in self._files(key):
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+            self.total_bytes -= self._sizes.pop(key)
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CrawlFrontier:
+    # Priority queue of URLs still to fetch: shallower pages first, then higher
+    # scores (such as a sitemap <priority>). The canonical form of a URL is
+    # its dedup key, so variants of an already queued URL are dropped; the
+    # URL itself is fetched as given, less any fragment.
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self.seen = set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, url, depth, score=0.0):
+        key = canonicalize_url(url)
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        heapq.heappush(self._heap, (depth, -score, next(self._counter), urldefrag(url)[0]))
+        return True
+
+    def pop(self):
+        depth, _, _, url = heapq.heappop(self._heap)
+        return url, depth
+
 class WebScraper:
-    def __init__(self, base_url, max_pages=10):
+    MAX_SITEMAPS = 20
+    USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+    def __init__(self, base_url, max_pages=10, workers=1, requests_per_second=1.0, burst=None, parser='auto',
+                 cache=None, use_sitemap=True):
+        import requests
+
         self.base_url = base_url
+        self.parser = parser
+        self.cache = cache
+        self.use_sitemap = use_sitemap
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
         self.visited_urls = set()
         self.max_pages = max_pages
-        parsed_url = urlparse(base_url)
+        self.workers = max(1, workers)
+        self.requests_per_second = requests_per_second
+        self.burst = burst if burst is not None else self.workers
+        parsed_url = urlparse(canonicalize_url(base_url))
         self.domain = parsed_url.netloc
-        
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = self.USER_AGENT
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def _bucket_for(self, url):
+        host = urlparse(url).netloc
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.requests_per_second, self.burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def _get(self, url, headers=None):
+        # The body is only downloaded once the headers say it is HTML;
+        # returns None for other content types.
+        with METRICS.timer('scraper_fetch_seconds'):
+            response = self.session.get(url, headers=headers, timeout=10, stream=True)
+            METRICS.inc('scraper_responses_total', status=response.status_code)
+            media_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if response.ok and media_type and media_type not in HTML_MEDIA_TYPES:
+                response.close()
+                logger.info(f"Skipping {url}: {media_type} is not HTML")
+                METRICS.inc('scraper_skipped_total', reason='content_type')
+                self._record('skipped_non_html')
+                return None
+            body = response.content
+        METRICS.inc('scraper_fetch_bytes_total', len(body))
+        return response
+
+    def _record(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def load_page(self, url):
+        entry = self.cache.get(url) if self.cache is not None else None
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        if self.requests_per_second:
+            self._bucket_for(url).acquire()
+        response = self._get(url, headers)
+        if response is None:
+            return None
+
+        if response.status_code == 304 and entry is not None:
+            self._record('cache_hits')
+            return {'url': url, 'text': entry['text'], 'links': entry['links'], 'unchanged': True}
+
+        response.raise_for_status()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        # Relative links resolve against the URL that was served, after redirects.
+        if self.cache is None:
+            text, links = self.parse_page(response.text, response.url)
+            return {'url': url, 'text': text, 'links': links}
+
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if entry is not None and entry.get('content_hash') == content_hash:
+            self._record('cache_hits')
+            self.cache.update_validators(url, entry, etag, last_modified)
+            return {'url': url, 'text': entry['text'], 'links': entry['links'], 'unchanged': True}
+
+        self._record('cache_misses')
+        text, links = self.parse_page(response.text, response.url)
+        self.cache.put(url, response.content, text, links, etag, last_modified, content_hash)
+        return {'url': url, 'text': text, 'links': links}
+
     def is_valid_url(self, url):
-        parsed = urlparse(url)
+        parsed = urlparse(canonicalize_url(url))
         return (parsed.netloc == self.domain or not parsed.netloc) and \
-               parsed.scheme in ('http', 'https', '')
+               parsed.scheme in ('http', 'https', '') and \
+               not parsed.path.lower().endswith(NON_HTML_EXTENSIONS)
     
     def extract_text(self, html):
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(html, 'html.parser')
         
         for script_or_style in soup(['script', 'style', 'header', 'footer', 'nav']):
             script_or_style.decompose()
             
-        text = soup.get_text()
-        
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        
-        return text
+        return clean_text(soup.get_text())
     
     def extract_links(self, html, base_url):
+        from bs4 import BeautifulSoup
+
         soup = BeautifulSoup(html, 'html.parser')
         links = []
         
@@ -87,115 +1184,703 @@ class WebScraper:
                 links.append(absolute_url)
                 
         return links
+
+    def parse_page(self, html, base_url):
+        with METRICS.timer('scraper_parse_seconds'):
+            text, hrefs = parse_html(html, self.parser)
+        links = []
+        for href in hrefs:
+            absolute_url = urljoin(base_url, href)
+            if self.is_valid_url(absolute_url):
+                links.append(absolute_url)
+        return text, links
     
     def scrape(self, url=None):
-        if url is None:
-            url = self.base_url
-            
-        if len(self.visited_urls) >= self.max_pages:
-            return []
-            
-        if url in self.visited_urls:
-            return []
-            
+        return list(self.iter_pages(url))
+
+    def iter_pages(self, url=None):
+        # Pages are yielded as soon as they are fetched. The crawl only advances
+        # when the consumer asks for the next page, so at most `workers` pages
+        # are in flight and slow indexing applies backpressure to fetching.
+        return self._crawl(url or self.base_url)
+
+    def _scrape_page(self, url):
         try:
             logger.info(f"Scraping {url}")
-            response = requests.get(url, headers={
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }, timeout=10)
-            response.raise_for_status()
-            
-            self.visited_urls.add(url)
-            html = response.text
-            
-            text = self.extract_text(html)
-            
-            links = self.extract_links(html, url)
-            
-            results = [{'url': url, 'text': text}]
-            
-            for link in links:
-                if len(self.visited_urls) < self.max_pages:
-                    time.sleep(1)
-                    results.extend(self.scrape(link))
-                else:
-                    break
-                    
-            return results
+            return self.load_page(url)
         except Exception as e:
             logger.error(f"Error scraping {url}: {e}")
-            return []
+            METRICS.inc('scraper_errors_total')
+            return None
+
+    def _crawl(self, start_url):
+        frontier = CrawlFrontier()
+        frontier.seen.update(self.visited_urls)
+        frontier.push(start_url, 0)
+        if self.use_sitemap:
+            for url, priority in self.sitemap_urls():
+                if self.is_valid_url(url):
+                    frontier.push(url, 1, priority)
+
+        fetched = 0
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while frontier or in_flight:
+                while frontier and len(in_flight) < self.workers and \
+                        fetched + len(in_flight) < self.max_pages:
+                    url, depth = frontier.pop()
+                    in_flight[pool.submit(self._scrape_page, url)] = (url, depth)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url, depth = in_flight.pop(future)
+                    page = future.result()
+                    if page is None:
+                        continue
+
+                    links = page.pop('links')
+                    self.visited_urls.add(canonicalize_url(url))
+                    fetched += 1
+                    for link in links:
+                        frontier.push(link, depth + 1)
+                    yield page
+
+    def sitemap_urls(self):
+        # (url, priority) pairs from the site's sitemaps: those listed in
+        # robots.txt, or /sitemap.xml. Sitemap index files are followed.
+        import xml.etree.ElementTree as ElementTree
+
+        parsed = urlparse(canonicalize_url(self.base_url))
+        root = f"{parsed.scheme}://{parsed.netloc}"
+        robots = self._fetch_resource(root + '/robots.txt')
+        pending = [line.split(':', 1)[1].strip() for line in (robots or '').splitlines()
+                   if line.lower().startswith('sitemap:')] or [root + '/sitemap.xml']
+
+        urls = []
+        limit = self.max_pages * 10
+        for sitemap_url in itertools.islice(pending, self.MAX_SITEMAPS):
+            body = self._fetch_resource(sitemap_url)
+            if not body:
+                continue
+            try:
+                tree = ElementTree.fromstring(body)
+            except ElementTree.ParseError:
+                logger.warning(f"Ignoring unparseable sitemap {sitemap_url}")
+                continue
+            for element in tree:
+                fields = {child.tag.rpartition('}')[2]: (child.text or '').strip() for child in element}
+                if not fields.get('loc'):
+                    continue
+                if element.tag.endswith('sitemap'):
+                    pending.append(fields['loc'])
+                    continue
+                try:
+                    priority = float(fields.get('priority', 0.5))
+                except ValueError:
+                    priority = 0.5
+                urls.append((fields['loc'], priority))
+            if len(urls) >= limit:
+                break
+
+        if urls:
+            logger.info(f"Seeded the crawl with {len(urls)} URLs from the sitemap")
+            self._record('sitemap_urls', len(urls))
+        return urls[:limit]
+
+    def _fetch_resource(self, url):
+        # Small non-HTML resources (robots.txt, sitemaps); missing ones are normal.
+        try:
+            if self.requests_per_second:
+                self._bucket_for(url).acquire()
+            response = self.session.get(url, timeout=10)
+            METRICS.inc('scraper_responses_total', status=response.status_code)
+            return response.content if response.status_code == 200 else None
+        except Exception as e:
+            logger.info(f"Could not fetch {url}: {e}")
+            return None
+
+NON_SPACE = re.compile(r'\S')
+SENTENCE_END = re.compile(r'[.!?]+[\'")\]]*(?=\s|$)')
+ABBREVIATIONS = frozenset([
+    'mr', 'mrs', 'ms', 'dr', 'prof', 'sr', 'jr', 'st', 'vs', 'etc', 'e.g', 'i.e', 'inc', 'ltd', 'co',
+    'corp', 'fig', 'no', 'vol', 'approx', 'dept', 'est', 'u.s', 'jan', 'feb', 'mar', 'apr', 'jun',
+    'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+])
+
+@functools.lru_cache(maxsize=None)
+def _punkt_tokenizer(language='english'):
+    # The tokenizer data is looked up, and downloaded if missing, on the first
+    # nltk chunking call instead of when the module is imported.
+    import nltk
+    from nltk.tokenize.punkt import PunktTokenizer
+    try:
+        return PunktTokenizer(language)
+    except LookupError:
+        logger.info("Downloading NLTK punkt tokenizer data")
+        if not nltk.download('punkt_tab', quiet=True):
+            raise LookupError("NLTK punkt tokenizer data is not installed and could not be downloaded "
+                              "(offline?). Install it with `python -m nltk.downloader punkt_tab`, "
+                              "or use the regex sentence splitter (--splitter regex).") from None
+        return PunktTokenizer(language)
+
+def nltk_sentence_spans(text, language='english'):
+    return list(_punkt_tokenizer(language).span_tokenize(text))
+
+def _skip_space(text, position):
+    match = NON_SPACE.search(text, position)
+    return match.start() if match else len(text)
+
+def regex_sentence_spans(text):
+    # Approximates Punkt: break after sentence punctuation followed by
+    # whitespace, except after known abbreviations, single-letter initials
+    # and ellipses that run on into a lowercase word.
+    spans = []
+    start = _skip_space(text, 0)
+    for match in SENTENCE_END.finditer(text):
+        end = match.end()
+        if end <= start:
+            continue
+        next_start = _skip_space(text, end)
+        punctuation = match.group()
+        if punctuation[0] == '.':
+            lower = max(start, match.start() - 40)
+            token_start = max(text.rfind(' ', lower, match.start()), text.rfind('\n', lower, match.start())) + 1
+            token = text[max(token_start, lower):match.start()].lstrip('([{"\'').lower()
+            if token in ABBREVIATIONS or (len(token) == 1 and token.isalpha()):
+                continue
+            if punctuation.startswith('..') and text[next_start:next_start + 1].islower():
+                continue
+        spans.append((start, end))
+        start = next_start
+
+    if start < len(text):
+        spans.append((start, len(text.rstrip())))
+    return spans
 
 class TextChunker:
-    def __init__(self, chunk_size=512, overlap=50):
+    def __init__(self, chunk_size=512, overlap=50, splitter='nltk', workers=1):
+        if splitter not in ('nltk', 'regex'):
+            raise ValueError(f"Unknown sentence splitter: {splitter}")
         self.chunk_size = chunk_size
         self.overlap = overlap
-        
-    def chunk_text(self, text, url):
-        sentences = sent_tokenize(text)
-        chunks = []
-        current_chunk = []
+        self.splitter = splitter
+        self.workers = workers
+        self._pool = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def sentence_spans(self, text):
+        if self.splitter == 'regex':
+            return regex_sentence_spans(text)
+        return nltk_sentence_spans(text)
+
+    def chunk_spans(self, text):
+        sentences = self.sentence_spans(text)
+        spans = []
+        first = 0
         current_length = 0
         
-        for sentence in sentences:
-            sentence_length = len(sentence)
+        for i, (start, end) in enumerate(sentences):
+            sentence_length = end - start
             
             if current_length + sentence_length <= self.chunk_size:
-                current_chunk.append(sentence)
                 current_length += sentence_length
-            else:
-                if current_chunk:
-                    chunks.append({
-                        'text': ' '.join(current_chunk),
-                        'url': url
-                    })
-                
-                overlap_sentences = []
-                overlap_length = 0
-                
-                for s in reversed(current_chunk):
-                    if overlap_length + len(s) <= self.overlap:
-                        overlap_sentences.insert(0, s)
-                        overlap_length += len(s)
-                    else:
-                        break
-                
-                current_chunk = overlap_sentences + [sentence]
-                current_length = overlap_length + sentence_length
+                continue
+            
+            if i > first:
+                spans.append((sentences[first][0], sentences[i - 1][1]))
+            
+            # Carry whole trailing sentences of the previous chunk, newest
+            # first, while they fit in the overlap budget.
+            overlap_start = i
+            overlap_length = 0
+            while overlap_start > first:
+                length = sentences[overlap_start - 1][1] - sentences[overlap_start - 1][0]
+                if overlap_length + length > self.overlap:
+                    break
+                overlap_start -= 1
+                overlap_length += length
+            
+            first = overlap_start
+            current_length = overlap_length + sentence_length
         
-        if current_chunk:
-            chunks.append({
-                'text': ' '.join(current_chunk),
-                'url': url
-            })
+        if first < len(sentences):
+            spans.append((sentences[first][0], sentences[-1][1]))
             
+        return spans
+
+    def _chunks_from_spans(self, text, url, spans):
+        # 'page' is the page text itself (not a copy), so the index can store
+        # it once and keep only offsets per chunk.
+        return [{'text': text[start:end], 'url': url, 'start': start, 'end': end, 'page': text}
+                for start, end in spans]
+
+    def chunk_text(self, text, url):
+        return self.chunk_many([{'text': text, 'url': url}])
+
+    def chunk_many(self, pages):
+        pages = list(pages)
+        start_time = time.perf_counter()
+        if self.workers <= 1 or len(pages) < 2:
+            all_spans = [self.chunk_spans(page['text']) for page in pages]
+        else:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            chunksize = max(1, len(pages) // (self.workers * 4))
+            # Only the texts go to the workers and only offsets come back.
+            all_spans = list(self._pool.map(self.chunk_spans, [page['text'] for page in pages], chunksize=chunksize))
+
+        chunks = []
+        for page, spans in zip(pages, all_spans):
+            chunks.extend(self._chunks_from_spans(page['text'], page['url'], spans))
+
+        elapsed = time.perf_counter() - start_time
+        METRICS.observe('chunker_seconds', elapsed)
+        METRICS.inc('chunker_pages_total', len(pages))
+        METRICS.inc('chunker_chars_total', sum(len(page['text']) for page in pages))
+        METRICS.inc('chunker_chunks_total', len(chunks))
+        if elapsed > 0:
+            METRICS.set('chunker_chunks_per_second', len(chunks) / elapsed)
         return chunks
 
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+class ChunkDeduplicator:
+    # Near-duplicate detection with MinHash signatures over word shingles and
+    # LSH banding: a chunk is only compared with earlier chunks that share at
+    # least one band, so the cost stays roughly linear in the number of
+    # chunks. The first chunk of a group is kept and collects the URLs of
+    # all its duplicates in chunk['urls'], even after it has been indexed.
+    # A kept chunk whose URL list has been emptied is no longer on any page
+    # and stops absorbing duplicates.
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, threshold=0.85, num_perm=64, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, self.PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, self.PRIME, size=num_perm).astype(np.uint64)
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+        self._urls = []
+        self._exact = {}
+        self.seen = 0
+        self.removed = 0
+        self.elapsed = 0.0
+
+    def signature(self, text):
+        words = text.lower().split()
+        k = self.shingle_size
+        shingles = {' '.join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) % self.PRIME for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((np.outer(hashes, self._a) + self._b) % self.PRIME).min(axis=0)
+
+    def _find_duplicate(self, signature):
+        checked = set()
+        for band, buckets in enumerate(self._buckets):
+            for candidate in buckets.get(signature[band * self.rows:(band + 1) * self.rows].tobytes(), ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if self._urls[candidate] and np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    return candidate
+        return None
+
+    def deduplicate(self, chunks):
+        start_time = time.perf_counter()
+        kept = []
+        for chunk in chunks:
+            self.seen += 1
+            text_key = hashlib.sha1(chunk['text'].encode('utf-8')).digest()
+            canonical = self._exact.get(text_key)
+            signature = None
+            if canonical is None or not self._urls[canonical]:
+                signature = self.signature(chunk['text'])
+                canonical = self._find_duplicate(signature)
+
+            if canonical is not None:
+                urls = self._urls[canonical]
+                if chunk['url'] not in urls:
+                    urls.append(chunk['url'])
+                self.removed += 1
+                continue
+
+            chunk['urls'] = [chunk['url']]
+            self._add(text_key, signature, chunk['urls'])
+            kept.append(chunk)
+
+        self.elapsed += time.perf_counter() - start_time
+        return kept
+
+    def seed(self, texts, url_lists):
+        # Registers chunks that are already kept, such as those of an existing
+        # index, with the URL lists that later duplicates are added to.
+        start_time = time.perf_counter()
+        for text, urls in zip(texts, url_lists):
+            text_key = hashlib.sha1(text.encode('utf-8')).digest()
+            self._add(text_key, self.signature(text), urls)
+        self.elapsed += time.perf_counter() - start_time
+
+    def _add(self, text_key, signature, urls):
+        index = len(self._urls)
+        self._urls.append(urls)
+        self._signatures.append(signature)
+        self._exact[text_key] = index
+        for band in range(self.bands):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            self._buckets[band].setdefault(key, []).append(index)
+
+    def summary(self):
+        share = self.removed / self.seen if self.seen else 0.0
+        return f"Deduplication removed {self.removed} of {self.seen} chunks ({share:.1%}) in {self.elapsed:.2f}s"
+
+class AnswerCache:
+    # Two-tier cache of generated answers: an in-memory LRU with a TTL in
+    # front of an optional directory of JSON files that survives restarts.
+    # Keys cover the normalized query, the model, the context packing budget
+    # and the content of the retrieved chunks, so re-indexed content or a
+    # differently packed prompt never hits a stale answer.
+    def __init__(self, max_entries=1024, ttl=24 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.latency_saved = 0.0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def normalize_query(query):
+        return ' '.join(query.lower().split()).rstrip('?!. ')
+
+    @classmethod
+    def make_key(cls, query, model, retrieved_docs, context_tokens=None):
+        chunk_ids = [hashlib.sha1(f"{doc['url']}\0{doc['text']}".encode('utf-8')).hexdigest()
+                     for doc in retrieved_docs]
+        payload = json.dumps([cls.normalize_query(query), model, context_tokens, chunk_ids])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+        if entry is None and self.path:
+            try:
+                with open(self._disk_path(key), encoding='utf-8') as f:
+                    stored = json.load(f)
+                if stored['expires_at'] > now:
+                    entry = (stored['expires_at'], stored['response'])
+                    self._remember(key, entry)
+                    self._record('disk_hits')
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if entry is None:
+            self._record('misses')
+            return None
+
+        response = entry[1]
+        with self.lock:
+            self.stats['hits'] += 1
+            self.latency_saved += response.get('generation_time') or 0.0
+        return response
+
+    def put(self, key, response):
+        entry = (time.time() + self.ttl, response)
+        self._remember(key, entry)
+        if self.path:
+            tmp_path = self._disk_path(key) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': entry[0], 'response': response}, f)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def _remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _record(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                'hits': self.stats['hits'],
+                'disk_hits': self.stats['disk_hits'],
+                'misses': self.stats['misses'],
+                'hit_rate': self.stats['hits'] / lookups if lookups else 0.0,
+                'latency_saved': self.latency_saved,
+                'entries': len(self.entries),
+            }
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text with BPE vocabularies;
+    # close enough for budgeting and much cheaper than running a tokenizer.
+    return (len(text) + 3) // 4
+
+def merge_overlapping(first, second, probe_length=64):
+    # Joins two chunks when one ends with the start of the other, as
+    # consecutive TextChunker chunks do; returns None when they don't touch.
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for head, tail in ((first, second), (second, first)):
+        at = head.find(tail[:probe_length])
+        while at != -1:
+            if tail.startswith(head[at:]):
+                return head[:at] + tail
+            at = head.find(tail[:probe_length], at + 1)
+    return None
+
+class ContextPacker:
+    # Turns retrieved chunks into prompt context: chunks from the same page
+    # that are adjacent or overlap are merged into one block, sentences
+    # already in the context are dropped, and blocks are added in descending
+    # score order until max_tokens is used. A sentence that does not fit is
+    # cut to the remaining budget, so retrieved docs never pack to nothing.
+    def __init__(self, max_tokens=2000, estimator=estimate_tokens):
+        self.max_tokens = max_tokens
+        self.estimator = estimator
+
+    def _blocks(self, retrieved_docs):
+        blocks = []
+        for doc in sorted(retrieved_docs, key=lambda doc: doc.get('score', 0.0), reverse=True):
+            block = {'text': doc['text'], 'url': doc['url'], 'score': doc.get('score', 0.0), 'docs': [doc]}
+            # Merging can make a block touch another one from the same page,
+            # so keep merging until nothing changes.
+            merged = True
+            while merged:
+                merged = False
+                for other in blocks:
+                    if other['url'] != block['url']:
+                        continue
+                    text = merge_overlapping(other['text'], block['text'])
+                    if text is not None:
+                        blocks.remove(other)
+                        block = {'text': text, 'url': block['url'], 'score': max(block['score'], other['score']),
+                                 'docs': other['docs'] + block['docs']}
+                        merged = True
+                        break
+            blocks.append(block)
+        return sorted(blocks, key=lambda block: block['score'], reverse=True)
+
+    def _truncate(self, sentence, budget):
+        # The longest whole-word prefix that fits the budget, or the first word.
+        words = sentence.split(' ')
+        low, high = 1, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.estimator(' '.join(words[:middle])) + 1 <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return ' '.join(words[:low])
+
+    def pack(self, retrieved_docs):
+        seen = set()
+        budget = self.max_tokens
+        packed = []
+        for block in self._blocks(retrieved_docs):
+            sentences = []
+            for start, end in regex_sentence_spans(block['text']):
+                sentence = block['text'][start:end]
+                key = ' '.join(sentence.lower().split())
+                if key in seen:
+                    continue
+                seen.add(key)
+                cost = self.estimator(sentence) + 1
+                if cost > budget:
+                    truncated = self._truncate(sentence, budget)
+                    if self.estimator(truncated) + 1 <= budget or not packed and not sentences:
+                        sentences.append(truncated)
+                    budget = 0
+                    break
+                budget -= cost
+                sentences.append(sentence)
+            if sentences:
+                sources = source_urls(block['docs'])
+                packed.append({
+                    'text': ' '.join(sentences),
+                    'url': block['url'],
+                    'score': block['score'],
+                    'sources': sources if len(sources) > 1 else None
+                })
+            if budget <= 0:
+                break
+        return packed
+
+def source_urls(retrieved_docs):
+    return list(dict.fromkeys(url for doc in retrieved_docs for url in doc.get('sources') or [doc['url']]))
+
 class RAGPipeline:
-    def __init__(self, api_key, model="qwen/qwq-32b:free", base_url="https://openrouter.ai/api/v1"):
+    def __init__(self, api_key, model="qwen/qwq-32b:free", base_url="https://openrouter.ai/api/v1", vector_db=None,
+                 retrieval_backend='tfidf', answer_cache=None, max_retries=3, retry_backoff=1.0,
+                 context_packer=None, sharded_index=None):
+        from openai import OpenAI
+
+        # Retries are handled in _create_completion so the policy is the same
+        # for single queries, streaming and batch runs.
         self.client = OpenAI(
             base_url=base_url,
-            api_key=api_key
+            api_key=api_key,
+            max_retries=0
         )
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
         self.model = model
-        self.vector_db = SimpleVectorDB()
+        self.vector_db = vector_db if vector_db is not None else SimpleVectorDB()
+        self.retrieval_backend = retrieval_backend
+        self.dense_index = None
+        self.sharded_index = sharded_index
+        self.answer_cache = answer_cache
+        self.context_packer = context_packer
         
     def index_documents(self, documents):
-        for doc in documents:
-            self.vector_db.add_document(doc['text'], doc['url'])
+        self.vector_db.add_chunks(documents)
+        self.dense_index = None
         
         logger.info(f"Indexed {len(documents)} documents in the vector database")
+
+    def index_stream(self, pages, chunker=None, batch_size=256, progress=None, replace_existing=False,
+                     deduplicator=None):
+        chunker = chunker or TextChunker()
+        # With replace_existing, chunks already indexed for a page are dropped
+        # just before that page's new chunks are added. The page's URL is
+        # detached from source lists before its new chunks are deduplicated,
+        # so they are not matched against content the page no longer has.
+        vector_db = self.vector_db
+        # Indexed URLs by canonical form, so a page matches however its URL
+        # was written when it was indexed.
+        existing_urls = {}
+        for url in (set(vector_db.urls) if replace_existing else ()):
+            existing_urls.setdefault(canonicalize_url(url), set()).add(url)
+        stale_urls = set()
+        page_count = chunk_count = 0
+        batch = []
+        # New chunks are also deduplicated against the indexed ones, whose
+        # source lists are shared with the deduplicator. Seeding is deferred
+        # to the first page, so a recrawl with no changed pages skips it.
+        seed = deduplicator is not None and len(vector_db.store) > 0
+
+        def flush():
+            if stale_urls:
+                vector_db.remove_urls(stale_urls, detach=False)
+                stale_urls.clear()
+            self.index_documents(batch)
+
+        # A multi-process chunker is fed groups of pages so each round trip to
+        # the pool carries enough work.
+        pages_per_group = chunker.workers * 2 if chunker.workers > 1 else 1
+        group = []
+        for page in itertools.chain(pages, [None]):
+            if page is not None:
+                page_count += 1
+                group.append(page)
+                if len(group) < pages_per_group:
+                    continue
+            if seed and group:
+                deduplicator.seed(vector_db.documents, [vector_db.sources.setdefault(i, [vector_db.store.url(i)])
+                                                        for i in range(len(vector_db.store))])
+                seed = False
+            chunks = chunker.chunk_many(group)
+            changed = set()
+            for key in {canonicalize_url(grouped['url']) for grouped in group}:
+                changed.update(existing_urls.pop(key, ()))
+            if changed:
+                vector_db.detach_urls(changed)
+                stale_urls.update(changed)
+            batch.extend(deduplicator.deduplicate(chunks) if deduplicator is not None else chunks)
+            group = []
+            if len(batch) >= batch_size:
+                flush()
+                chunk_count += len(batch)
+                batch = []
+            if progress is not None:
+                progress(page_count, chunk_count + len(batch))
+
+        if batch or stale_urls:
+            flush()
+            chunk_count += len(batch)
+        if progress is not None:
+            progress(page_count, chunk_count)
+        if deduplicator is not None:
+            logger.info(deduplicator.summary())
+        return page_count, chunk_count
+
+    def save(self, path):
+        self.vector_db.save(path)
+        logger.info(f"Saved index with {len(self.vector_db.documents)} documents to {path}")
+
+    @classmethod
+    def load(cls, path, api_key, **kwargs):
+        vector_db = SimpleVectorDB.load(path)
+        logger.info(f"Loaded index with {len(vector_db.documents)} documents from {path}")
+        return cls(api_key, vector_db=vector_db, **kwargs)
         
-    def retrieve(self, query, top_k=3):
-        return self.vector_db.search(query, top_k=top_k)
+    def build_dense_index(self, **kwargs):
+        self.dense_index = DenseVectorIndex(self.vector_db, **kwargs).build()
+        return self.dense_index
+
+    def _backend(self, backend):
+        backend = backend or self.retrieval_backend
+        if backend == 'tfidf':
+            return self.vector_db
+        if backend == 'dense':
+            if self.dense_index is None:
+                self.build_dense_index()
+            return self.dense_index
+        if backend == 'sharded':
+            if self.sharded_index is None:
+                raise ValueError("The sharded backend needs a ShardedIndex")
+            return self.sharded_index
+        raise ValueError(f"Unknown retrieval backend: {backend}")
+
+    def retrieve(self, query, top_k=3, backend=None):
+        with METRICS.timer('rag_retrieve_seconds', backend=backend or self.retrieval_backend):
+            return self._backend(backend).search(query, top_k=top_k)
+
+    def retrieve_many(self, queries, top_k=3, backend=None):
+        with METRICS.timer('rag_retrieve_many_seconds', backend=backend or self.retrieval_backend):
+            return self._backend(backend).search_many(queries, top_k=top_k)
         
-    def generate(self, query, retrieved_docs):
+    def build_prompt(self, query, retrieved_docs):
         if not retrieved_docs:
-            prompt = f"Please answer the following question: {query}"
-        else:
-            context = "\n\n".join([f"[Source: {doc['url']}]\n{doc['text']}" for doc in retrieved_docs])
-            
-            prompt = f"""Use the following information to answer the question. If the information provided doesn't contain the answer, say so.
+            return f"Please answer the following question: {query}"
+
+        context = "\n\n".join([f"[Source: {doc['url']}]\n{doc['text']}" for doc in retrieved_docs])
+        
+        return f"""Use the following information to answer the question. If the information provided doesn't contain the answer, say so.
 
 INFORMATION:
 {context}
@@ -203,63 +1888,300 @@ INFORMATION:
 QUESTION: {query}
 
 ANSWER:"""
+
+    def pack_prompt(self, query, retrieved_docs):
+        # Returns the prompt along with its estimated token count before and
+        # after context packing.
+        prompt = self.build_prompt(query, retrieved_docs)
+        tokens = {'before': estimate_tokens(prompt), 'after': estimate_tokens(prompt)}
+        if self.context_packer is not None and retrieved_docs:
+            prompt = self.build_prompt(query, self.context_packer.pack(retrieved_docs))
+            tokens['after'] = estimate_tokens(prompt)
+            logger.info(f"Packed prompt from {tokens['before']} to {tokens['after']} estimated tokens")
+        METRICS.observe('rag_prompt_tokens', tokens['after'], buckets=(250, 500, 1000, 2000, 4000, 8000, 16000))
+        return prompt, tokens
+
+    def _create_completion(self, prompt, stream=False):
+        import openai
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.client.chat.completions.create(
+                    extra_headers={
+                        "HTTP-Referer": "https://custom-rag-agent.com",
+                        "X-Title": "Custom RAG Agent",
+                    },
+                    model=self.model,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt
+                        }
+                    ],
+                    stream=stream
+                )
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                METRICS.inc('rag_llm_retries_total', error=e.__class__.__name__)
+                logger.warning(f"LLM request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _retry_delay(self, error, attempt):
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            return min(60.0, float(retry_after))
+        except (TypeError, ValueError):
+            return self.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+
+    def _cached_answer(self, query, retrieved_docs):
+        if self.answer_cache is None:
+            return None, None
+        context_tokens = self.context_packer.max_tokens if self.context_packer is not None else None
+        key = self.answer_cache.make_key(query, self.model, retrieved_docs, context_tokens)
+        cached = self.answer_cache.get(key)
+        METRICS.inc('rag_answer_cache_total', result='miss' if cached is None else 'hit')
+        if cached is not None:
+            logger.info("Answer cache hit")
+            cached = dict(cached, cached=True)
+        return key, cached
+
+    def generate(self, query, retrieved_docs):
+        cache_key, cached = self._cached_answer(query, retrieved_docs)
+        if cached is not None:
+            return cached
+        
+        prompt, prompt_tokens = self.pack_prompt(query, retrieved_docs)
+        start_time = time.perf_counter()
         
         try:
-            completion = self.client.chat.completions.create(
-                extra_headers={
-                    "HTTP-Referer": "https://custom-rag-agent.com",
-                    "X-Title": "Custom RAG Agent",
-                },
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
-            return {
+            completion = self._create_completion(prompt)
+            generation_time = time.perf_counter() - start_time
+            METRICS.observe('rag_generate_seconds', generation_time, stream=False)
+            logger.info(f"Generated response in {generation_time:.2f}s")
+            response = {
                 "answer": completion.choices[0].message.content,
-                "sources": [doc['url'] for doc in retrieved_docs]
+                "sources": source_urls(retrieved_docs),
+                "generation_time": generation_time,
+                "prompt_tokens": prompt_tokens
             }
+            if cache_key is not None:
+                self.answer_cache.put(cache_key, response)
+            return response
         except Exception as e:
             logger.error(f"Error generating response: {e}")
+            METRICS.inc('rag_llm_errors_total')
             return {
                 "answer": "Sorry, I encountered an error while generating a response.",
-                "sources": []
+                "sources": [],
+                "error": str(e)
             }
 
-def main(base_url, api_key, query=None, max_pages=5):
-    logger.info(f"Starting to scrape {base_url}")
-    scraper = WebScraper(base_url, max_pages=max_pages)
-    scraped_data = scraper.scrape()
-    
-    if not scraped_data:
-        return "No data could be scraped from the provided URL."
-    
-    logger.info(f"Scraped {len(scraped_data)} pages from {base_url}")
+    def answer_batch(self, queries, top_k=3, max_in_flight=8, backend=None):
+        # Retrieval runs as one batched search; generation calls share the
+        # pipeline's HTTP client with at most max_in_flight outstanding.
+        # Results come back in input order.
+        queries = list(queries)
+        retrieved = self.retrieve_many(queries, top_k=top_k, backend=backend)
+        with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as pool:
+            yield from pool.map(self.generate, queries, retrieved)
+
+    def generate_stream(self, query, retrieved_docs):
+        # Yields {'type': 'delta', 'text': ...} as answer tokens arrive, then one
+        # {'type': 'final', ...} record with the full answer, sources and timings.
+        cache_key, cached = self._cached_answer(query, retrieved_docs)
+        if cached is not None:
+            yield {'type': 'delta', 'text': cached['answer']}
+            yield dict(cached, type='final', time_to_first_token=0.0)
+            return
+
+        prompt, prompt_tokens = self.pack_prompt(query, retrieved_docs)
+        start_time = time.perf_counter()
+        time_to_first_token = None
+        parts = []
+
+        try:
+            for chunk in self._create_completion(prompt, stream=True):
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if not text:
+                    continue
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start_time
+                parts.append(text)
+                yield {'type': 'delta', 'text': text}
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            METRICS.inc('rag_llm_errors_total')
+            yield {
+                'type': 'final',
+                'answer': "Sorry, I encountered an error while generating a response.",
+                'sources': [],
+                'time_to_first_token': time_to_first_token,
+                'generation_time': time.perf_counter() - start_time
+            }
+            return
+
+        generation_time = time.perf_counter() - start_time
+        METRICS.observe('rag_generate_seconds', generation_time, stream=True)
+        if time_to_first_token is not None:
+            METRICS.observe('rag_time_to_first_token_seconds', time_to_first_token)
+            logger.info(f"Streamed response: first token after {time_to_first_token:.2f}s, "
+                        f"complete after {generation_time:.2f}s")
+        response = {
+            'answer': ''.join(parts),
+            'sources': source_urls(retrieved_docs),
+            'generation_time': generation_time,
+            'prompt_tokens': prompt_tokens
+        }
+        if cache_key is not None:
+            self.answer_cache.put(cache_key, response)
+        yield dict(response, type='final', time_to_first_token=time_to_first_token)
+
+def run_batch(rag_pipeline, batch_file, output_path, top_k=3, max_in_flight=8, backend=None):
+    records = []
+    with open(batch_file, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                records.append(record if isinstance(record, dict) else {'query': record})
+
+    start_time = time.perf_counter()
+    failures = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        responses = rag_pipeline.answer_batch([record['query'] for record in records], top_k=top_k,
+                                              max_in_flight=max_in_flight, backend=backend)
+        for record, response in zip(records, responses):
+            failures += 'error' in response
+            out.write(json.dumps(dict(record, **response)) + '\n')
+
+    elapsed = time.perf_counter() - start_time
+    logger.info(f"Answered {len(records)} queries in {elapsed:.1f}s ({failures} failed)")
+    return {
+        "status": "success",
+        "message": f"Answered {len(records)} queries in {elapsed:.1f}s with {failures} failures; "
+                   f"results written to {output_path}."
+    }
+
+def pipeline_options(llm_base_url=None, context_tokens=2000, answer_cache_dir=None):
+    # RAGPipeline keyword arguments shared by the CLI and the query service.
+    llm_options = {'base_url': llm_base_url} if llm_base_url else {}
+    if context_tokens:
+        llm_options['context_packer'] = ContextPacker(max_tokens=context_tokens)
+    if answer_cache_dir:
+        llm_options['answer_cache'] = AnswerCache(path=answer_cache_dir)
+    return llm_options
+
+def main(base_url, api_key, *, query=None, max_pages=5, workers=4, rate_limit=4.0, index_path=None, save_path=None,
+         cache_dir=None, backend='tfidf', splitter='nltk', chunk_workers=1, llm_base_url=None, stream=False,
+         answer_cache_dir=None, batch_file=None, output_path=None, max_in_flight=8, dedup=True,
+         context_tokens=2000, use_sitemap=True, shards_path=None, shard_name=None, remove_shard=None):
+    llm_options = pipeline_options(llm_base_url, context_tokens, answer_cache_dir)
+    rag_pipeline = None
+    sharded = None
+    if shards_path:
+        # A crawl builds or updates the shard for its site; queries search all shards.
+        sharded = ShardedIndex(shards_path)
+        if remove_shard:
+            if remove_shard not in sharded.shards:
+                return f"No shard named {remove_shard} in {shards_path}."
+            sharded.remove_shard(remove_shard)
+        summary = f"Sharded index at {shards_path} has {len(sharded.shards)} shards: {', '.join(sharded.shards)}."
+        if base_url:
+            shard_name = shard_name or urlparse(base_url).netloc
+            index_path = sharded.shard_path(shard_name)
+            save_path = None
     
-    chunker = TextChunker()
-    chunks = []
-    for data in scraped_data:
-        chunks.extend(chunker.chunk_text(data['text'], data['url']))
+    if index_path and os.path.exists(os.path.join(index_path, 'index.json')):
+        rag_pipeline = RAGPipeline.load(index_path, api_key, **llm_options)
+        summary = f"Loaded {len(rag_pipeline.vector_db.documents)} text chunks from {index_path}."
+    elif not base_url and sharded is None:
+        return f"No index found at {index_path}."
     
-    logger.info(f"Created {len(chunks)} text chunks for indexing")
+    if base_url:
+        logger.info(f"Starting to scrape {base_url}")
+        cache = PageCache(cache_dir) if cache_dir else None
+        scraper = WebScraper(base_url, max_pages=max_pages, workers=workers, requests_per_second=rate_limit,
+                             cache=cache, use_sitemap=use_sitemap)
+        
+        if rag_pipeline is None:
+            rag_pipeline = RAGPipeline(api_key, **llm_options)
+            indexed_urls = set()
+        else:
+            indexed_urls = {canonicalize_url(url) for url in set(rag_pipeline.vector_db.urls)}
+        
+        crawled = Counter()
+        
+        def changed_pages():
+            for page in scraper.iter_pages():
+                crawled['pages'] += 1
+                # Pages the cache reports as unchanged are already in the loaded index.
+                if page.get('unchanged') and canonicalize_url(page['url']) in indexed_urls:
+                    continue
+                crawled['changed'] += 1
+                yield page
+        
+        def report(pages, chunks):
+            logger.info(f"Progress: {crawled['pages']} pages crawled, {pages} pages chunked, {chunks} chunks")
+        
+        chunker = TextChunker(splitter=splitter, workers=chunk_workers)
+        deduplicator = ChunkDeduplicator() if dedup else None
+        try:
+            _, chunk_count = rag_pipeline.index_stream(changed_pages(), chunker, progress=report,
+                                                       replace_existing=bool(indexed_urls),
+                                                       deduplicator=deduplicator)
+        finally:
+            chunker.close()
+        
+        if not crawled['pages']:
+            return "No data could be scraped from the provided URL."
+        
+        logger.info(f"Scraped {crawled['pages']} pages from {base_url} and created {chunk_count} text chunks")
+        summary = f"Successfully scraped {crawled['pages']} pages and indexed {chunk_count} text chunks " \
+                  f"from {crawled['changed']} new or changed pages."
+        if deduplicator is not None:
+            summary += f" {deduplicator.summary()}."
+        if cache is not None:
+            logger.info(f"Crawl summary: {scraper.stats['cache_hits']} cache hits, "
+                        f"{scraper.stats['cache_misses']} cache misses")
+            summary += f" Page cache: {scraper.stats['cache_hits']} hits, {scraper.stats['cache_misses']} misses."
+        
+        save_path = save_path or index_path
+        if indexed_urls and not crawled['changed'] and save_path == index_path:
+            summary += " Index unchanged."
+        elif sharded is not None:
+            sharded.add_shard(shard_name, rag_pipeline.vector_db, base_url)
+            summary += f" Saved as shard {shard_name}."
+        elif save_path:
+            rag_pipeline.save(save_path)
     
-    rag_pipeline = RAGPipeline(api_key)
+    if sharded is not None:
+        rag_pipeline = RAGPipeline(api_key, sharded_index=sharded, **llm_options)
+        backend = 'sharded'
     
-    rag_pipeline.index_documents(chunks)
+    if batch_file:
+        return run_batch(rag_pipeline, batch_file, output_path or batch_file + '.answers.jsonl',
+                         max_in_flight=max_in_flight, backend=backend)
     
     if query:
-        retrieved_docs = rag_pipeline.retrieve(query)
+        retrieved_docs = rag_pipeline.retrieve(query, backend=backend)
         
-        response = rag_pipeline.generate(query, retrieved_docs)
+        if not stream:
+            return rag_pipeline.generate(query, retrieved_docs)
         
-        return response
+        for event in rag_pipeline.generate_stream(query, retrieved_docs):
+            if event['type'] == 'delta':
+                print(event['text'], end='', flush=True)
+        print()
+        return event
     else:
         return {
             "status": "success",
-            "message": f"Successfully scraped and indexed {len(chunks)} text chunks from {len(scraped_data)} pages.",
+            "message": summary,
             "ready_for_queries": True
         }
 
@@ -267,12 +2189,49 @@ if __name__ == "__main__":
     import argparse
     
     parser = argparse.ArgumentParser(description="Web Scraping and RAG Pipeline")
-    parser.add_argument("--url", required=True, help="Base URL to scrape")
+    parser.add_argument("--url", help="Base URL to scrape")
     parser.add_argument("--api_key", required=True, help="OpenRouter API Key")
     parser.add_argument("--query", help="Query to run against the RAG pipeline")
     parser.add_argument("--max_pages", type=int, default=5, help="Maximum number of pages to scrape")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent fetch workers")
+    parser.add_argument("--rate_limit", type=float, default=4.0, help="Maximum requests per second per host")
+    parser.add_argument("--index", help="Existing index directory; queried directly, or updated when --url is also given")
+    parser.add_argument("--save_index", help="Directory to save the built index to (defaults to --index)")
+    parser.add_argument("--cache_dir", help="Directory for the HTTP page cache used to skip unchanged pages on recrawls")
+    parser.add_argument("--backend", choices=['tfidf', 'dense'], default='tfidf',
+                        help="Retrieval backend: exact TF-IDF or the LSA approximate-nearest-neighbour index")
+    parser.add_argument("--shards", help="Sharded multi-site index directory; --url adds or rebuilds one shard and "
+                                         "queries search all shards")
+    parser.add_argument("--shard", help="Shard name for --url (defaults to the site's host name)")
+    parser.add_argument("--remove_shard", help="Remove this shard from --shards")
+    parser.add_argument("--splitter", choices=['nltk', 'regex'], default='nltk',
+                        help="Sentence splitter used for chunking")
+    parser.add_argument("--chunk_workers", type=int, default=1, help="Processes used for chunking")
+    parser.add_argument("--llm_base_url", help="OpenAI-compatible API base URL (defaults to OpenRouter)")
+    parser.add_argument("--stream", action="store_true", help="Print the answer as it is generated")
+    parser.add_argument("--answer_cache_dir", help="Directory for the on-disk answer cache shared across runs")
+    parser.add_argument("--batch_file", help="JSONL file of queries ({\"query\": ...} per line) to answer in bulk")
+    parser.add_argument("--output", help="JSONL file for batch results (defaults to <batch_file>.answers.jsonl)")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="Maximum concurrent LLM requests in batch mode")
+    parser.add_argument("--no_dedup", action="store_true", help="Index near-duplicate chunks instead of merging them")
+    parser.add_argument("--context_tokens", type=int, default=2000,
+                        help="Estimated token budget for retrieved context in the prompt (0 sends every chunk unpacked)")
+    parser.add_argument("--no_sitemap", action="store_true", help="Don't seed the crawl from the site's sitemap.xml")
+    parser.add_argument("--metrics_out", help="Write pipeline metrics to this file (.json, otherwise Prometheus text)")
     
     args = parser.parse_args()
+    if not args.url and not args.index and not args.shards:
+        parser.error("one of --url, --index or --shards is required")
     
-    result = main(args.url, args.api_key, args.query, args.max_pages)
+    result = main(args.url, args.api_key, query=args.query, max_pages=args.max_pages, workers=args.workers,
+                  rate_limit=args.rate_limit, index_path=args.index, save_path=args.save_index,
+                  cache_dir=args.cache_dir, backend=args.backend, splitter=args.splitter,
+                  chunk_workers=args.chunk_workers, llm_base_url=args.llm_base_url, stream=args.stream,
+                  answer_cache_dir=args.answer_cache_dir, batch_file=args.batch_file, output_path=args.output,
+                  max_in_flight=args.max_in_flight, dedup=not args.no_dedup, context_tokens=args.context_tokens,
+                  use_sitemap=not args.no_sitemap, shards_path=args.shards, shard_name=args.shard,
+                  remove_shard=args.remove_shard)
     print(result)
+    if args.metrics_out:
+        with open(args.metrics_out, 'w', encoding='utf-8') as f:
+            f.write(METRICS.to_json() if args.metrics_out.endswith('.json') else METRICS.to_prometheus())
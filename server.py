@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from rag_agent import METRICS, AnswerCache, RAGPipeline, ShardedIndex, pipeline_options
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1 << 20
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error', 502: 'Bad Gateway'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    # Minimal HTTP/1.1 request parser: request line, headers and a
+    # Content-Length body. Returns None when the client closed the connection.
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HTTPError(400, "Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, "Request headers too large")
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if 'transfer-encoding' in headers:
+        raise HTTPError(400, "Chunked request bodies are not supported")
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+async def write_response(writer, status, body, content_type='application/json', keep_alive=True):
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+class QueryService:
+    # Serves one loaded pipeline to many concurrent clients. Retrieval requests
+    # that arrive within batch_window seconds of each other are answered by a
+    # single search_many call, and identical answer requests that are in
+    # flight at the same time share one retrieval and one LLM call.
+    def __init__(self, rag_pipeline, top_k=3, backend=None, batch_window=0.005, max_batch=64, max_in_flight=8,
+                 max_top_k=20, coalesce=True):
+        self.rag_pipeline = rag_pipeline
+        self.top_k = top_k
+        self.backend = backend
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.max_top_k = max_top_k
+        self.coalesce = coalesce
+        self.started_at = time.time()
+        # One thread runs the batched searches in order, so a batch keeps
+        # filling while the previous one is searched; generation calls get
+        # their own pool, bounding the LLM requests in flight.
+        self._search_executor = ThreadPoolExecutor(max_workers=1)
+        self._generate_executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight))
+        self._pending = []
+        self._flush_handle = None
+        self._in_flight = {}
+
+    def documents(self):
+        if (self.backend or self.rag_pipeline.retrieval_backend) == 'sharded':
+            return sum(len(db.store) for db in self.rag_pipeline.sharded_index.shards.values())
+        return len(self.rag_pipeline.vector_db.store)
+
+    async def retrieve(self, query, top_k=None):
+        top_k = self.top_k if top_k is None else top_k
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((query, top_k, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._search_batch(batch))
+
+    async def _search_batch(self, batch):
+        # Repeated queries in a batch are searched once, at the largest top_k
+        # asked for; results are ranked, so smaller top_k are prefixes.
+        queries = list(dict.fromkeys(query for query, _, _ in batch))
+        top_k = max(top_k for _, top_k, _ in batch)
+        METRICS.observe('server_retrieve_batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._search_executor, self.rag_pipeline.retrieve_many, queries, top_k, self.backend)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_query = dict(zip(queries, results))
+        for query, k, future in batch:
+            if not future.done():
+                future.set_result(by_query[query][:k])
+
+    async def answer(self, query, top_k=None):
+        top_k = self.top_k if top_k is None else top_k
+        if not self.coalesce:
+            return await self._answer(query, top_k)
+        key = (AnswerCache.normalize_query(query), top_k)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(self._answer(query, top_k))
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            METRICS.inc('server_answer_coalesced_total')
+        # A client that disconnects must not cancel the call others wait on.
+        return await asyncio.shield(task)
+
+    async def _answer(self, query, top_k):
+        retrieved_docs = await self.retrieve(query, top_k)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._generate_executor, self.rag_pipeline.generate, query, retrieved_docs)
+
+    def _query_params(self, method, target, body):
+        if method == 'GET':
+            params = {key: values[-1] for key, values in parse_qs(urlparse(target).query).items()}
+        else:
+            try:
+                params = json.loads(body or b'{}')
+            except ValueError:
+                raise HTTPError(400, "Request body is not valid JSON")
+            if not isinstance(params, dict):
+                raise HTTPError(400, "Request body must be a JSON object")
+
+        query = params.get('query')
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "A non-empty 'query' is required")
+        try:
+            top_k = int(params.get('top_k', self.top_k))
+        except (TypeError, ValueError):
+            raise HTTPError(400, "'top_k' must be an integer")
+        if not 1 <= top_k <= self.max_top_k:
+            raise HTTPError(400, f"'top_k' must be between 1 and {self.max_top_k}")
+        return query, top_k
+
+    async def dispatch(self, method, target, body):
+        # Returns (status, body, content type).
+        path = urlparse(target).path.rstrip('/') or '/'
+        if path == '/health':
+            if method != 'GET':
+                raise HTTPError(405, "Use GET")
+            return 200, json.dumps({
+                'status': 'ok',
+                'documents': self.documents(),
+                'backend': self.backend or self.rag_pipeline.retrieval_backend,
+                'answers_in_flight': len(self._in_flight),
+                'uptime': time.time() - self.started_at
+            }), 'application/json'
+        if path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(405, "Use GET")
+            return 200, METRICS.to_prometheus(), 'text/plain; version=0.0.4'
+        if path in ('/retrieve', '/answer'):
+            if method not in ('GET', 'POST'):
+                raise HTTPError(405, "Use GET or POST")
+            query, top_k = self._query_params(method, target, body)
+            if path == '/retrieve':
+                results = await self.retrieve(query, top_k)
+                return 200, json.dumps({'query': query, 'results': results}), 'application/json'
+            response = await self.answer(query, top_k)
+            return 502 if 'error' in response else 200, json.dumps(dict(response, query=query)), 'application/json'
+        raise HTTPError(404, f"No endpoint {path}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await write_response(writer, e.status, json.dumps({'error': str(e)}), keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                endpoint = urlparse(target).path.rstrip('/') or '/'
+                start_time = time.perf_counter()
+                try:
+                    status, payload, content_type = await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, payload, content_type = e.status, json.dumps({'error': str(e)}), 'application/json'
+                except Exception as e:
+                    logger.error(f"Error handling {method} {endpoint}: {e}")
+                    status, payload, content_type = 500, json.dumps({'error': str(e)}), 'application/json'
+                if status != 404:
+                    METRICS.observe('server_request_seconds', time.perf_counter() - start_time, endpoint=endpoint)
+                METRICS.inc('server_requests_total', endpoint=endpoint if status != 404 else 'unknown',
+                            status=status)
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await write_response(writer, status, payload, content_type, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Cancelled on shutdown; the connection is closed either way.
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self._search_executor.shutdown()
+        self._generate_executor.shutdown()
+
+
+async def serve(service, host='127.0.0.1', port=8000):
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    logger.info(f"Serving {service.documents()} documents on http://{host}:{server.sockets[0].getsockname()[1]}/")
+    async with server:
+        await server.serve_forever()
+
+
+class ServiceThread(threading.Thread):
+    # Runs a QueryService on its own event loop in a daemon thread, for
+    # benchmarks and embedding in other programs.
+    def __init__(self, service, host='127.0.0.1', port=0):
+        super().__init__(daemon=True)
+        self.service = service
+        self.host = host
+        self.port = port
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+        self.url = None
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(asyncio.start_server(self.service.handle_connection, self.host,
+                                                                   self.port))
+        self.url = f"http://{self.host}:{server.sockets[0].getsockname()[1]}"
+        self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            # Idle keep-alive connections are still waiting for requests.
+            server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(server.wait_closed())
+            self.loop.close()
+
+    def shutdown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join()
+
+
+def start_service(service, host='127.0.0.1', port=0):
+    # Returns the running ServiceThread and its base URL.
+    thread = ServiceThread(service, host, port)
+    thread.start()
+    thread.ready.wait()
+    return thread, thread.url
+
+
+def load_pipeline(api_key, *, index_path=None, shards_path=None, backend='tfidf', llm_base_url=None,
+                  answer_cache_dir=None, context_tokens=2000):
+    llm_options = pipeline_options(llm_base_url, context_tokens, answer_cache_dir)
+    if shards_path:
+        return RAGPipeline(api_key, sharded_index=ShardedIndex(shards_path), retrieval_backend='sharded',
+                           **llm_options)
+    if not os.path.exists(os.path.join(index_path, 'index.json')):
+        raise FileNotFoundError(f"No index found at {index_path}")
+    rag_pipeline = RAGPipeline.load(index_path, api_key, retrieval_backend=backend, **llm_options)
+    if backend == 'dense':
+        rag_pipeline.build_dense_index()
+    return rag_pipeline
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="HTTP query service over a saved RAG index")
+    parser.add_argument("--index", help="Index directory saved by rag_agent.py")
+    parser.add_argument("--shards", help="Sharded index directory, searched instead of --index")
+    parser.add_argument("--api_key", required=True, help="OpenRouter API Key")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--backend", choices=['tfidf', 'dense'], default='tfidf',
+                        help="Retrieval backend: exact TF-IDF or the LSA approximate-nearest-neighbour index")
+    parser.add_argument("--top_k", type=int, default=3, help="Chunks retrieved per query unless a request sets top_k")
+    parser.add_argument("--batch_window_ms", type=float, default=5.0,
+                        help="Milliseconds to wait for more retrieval requests before searching a batch")
+    parser.add_argument("--max_batch", type=int, default=64, help="Largest retrieval batch")
+    parser.add_argument("--max_in_flight", type=int, default=8, help="Maximum concurrent LLM requests")
+    parser.add_argument("--no_coalesce", action="store_true", help="Do not share LLM calls between identical queries")
+    parser.add_argument("--llm_base_url", help="OpenAI-compatible API base URL (defaults to OpenRouter)")
+    parser.add_argument("--answer_cache_dir", help="Directory for the on-disk answer cache")
+    parser.add_argument("--context_tokens", type=int, default=2000,
+                        help="Token budget for retrieved context in the prompt (0 disables packing)")
+    args = parser.parse_args()
+    if not args.index and not args.shards:
+        parser.error("one of --index or --shards is required")
+
+    rag_pipeline = load_pipeline(args.api_key, index_path=args.index, shards_path=args.shards, backend=args.backend,
+                                 llm_base_url=args.llm_base_url, answer_cache_dir=args.answer_cache_dir,
+                                 context_tokens=args.context_tokens)
+    service = QueryService(rag_pipeline,
+                           top_k=args.top_k, batch_window=args.batch_window_ms / 1000, max_batch=args.max_batch,
+                           max_in_flight=args.max_in_flight, coalesce=not args.no_coalesce)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,68 @@
+import numpy as np
+
+from rag_agent import ChunkStore, MappedTexts
+
+PAGE = "Caches keep hot data close. Évictions free space for new entries."
+
+
+def build_store():
+    store = ChunkStore()
+    page_id = store.add_page(PAGE, "https://example.com/a")
+    store.add_chunk(page_id, 0, 27)
+    # The same page object is not stored twice.
+    assert store.add_page(PAGE, "https://example.com/a") == page_id
+    store.add_chunk(page_id, 20, len(PAGE))
+    other = store.add_page("Queues smooth bursts.", "https://example.com/b")
+    store.add_chunk(other, 0, 6)
+    return store
+
+
+def test_chunks_slice_shared_pages():
+    store = build_store()
+    assert len(store) == 3
+    assert len(store.pages) == 2
+    assert store.text(0) == PAGE[:27]
+    assert store.text(1) == PAGE[20:]
+    assert store.text(2) == "Queues"
+    assert [store.url(i) for i in range(3)] == ["https://example.com/a"] * 2 + ["https://example.com/b"]
+
+
+def test_urls_are_interned():
+    store = build_store()
+    page_id = store.add_page("Another page.", "https://example.com/a")
+    store.add_chunk(page_id, 0, 7)
+    assert store.url_table == ["https://example.com/a", "https://example.com/b"]
+    assert store.url_ids(["https://example.com/b", "https://example.com/missing"]) == [1]
+    assert list(store.chunk_url_ids()) == [0, 0, 1, 0]
+
+
+def test_compact_drops_unreferenced_pages():
+    store = build_store()
+    store.compact(np.array([2]))
+    assert len(store) == 1
+    assert store.pages == ["Queues smooth bursts."]
+    assert store.text(0) == "Queues"
+    assert store.url(0) == "https://example.com/b"
+
+
+def test_move_chunk_detaches_it_from_its_page():
+    store = build_store()
+    store.move_chunk(1, "https://example.com/c")
+    store.compact(np.array([1, 2]))
+    assert store.text(0) == PAGE[20:]
+    assert store.url(0) == "https://example.com/c"
+    assert len(store.pages) == 2
+
+
+def test_save_load_maps_page_texts(tmp_path):
+    store = build_store()
+    meta = store.save(str(tmp_path))
+    loaded = ChunkStore.load(str(tmp_path), meta)
+    assert isinstance(loaded.pages, MappedTexts)
+    assert [loaded.text(i) for i in range(3)] == [store.text(i) for i in range(3)]
+    assert [loaded.url(i) for i in range(3)] == [store.url(i) for i in range(3)]
+
+    page_id = loaded.add_page("Fresh page.", "https://example.com/d")
+    loaded.add_chunk(page_id, 0, 5)
+    assert loaded.text(3) == "Fresh"
+    assert loaded.text(1) == PAGE[20:]
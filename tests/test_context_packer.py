@@ -0,0 +1,46 @@
+from rag_agent import ContextPacker, TextChunker, estimate_tokens
+
+
+def doc(text, url, score):
+    return {'text': text, 'url': url, 'score': score}
+
+
+def test_blocks_are_packed_in_score_order():
+    docs = [
+        doc("Page one opens with background. It has many words of filler.", "https://a", 0.9),
+        doc("Page two answers the question directly.", "https://b", 0.8),
+        doc("Page one also has a weak tangent that barely matches.", "https://a", 0.1),
+    ]
+    packed = ContextPacker(max_tokens=1000).pack(docs)
+    assert [block['url'] for block in packed] == ["https://a", "https://b", "https://a"]
+    assert [block['score'] for block in packed] == [0.9, 0.8, 0.1]
+
+
+def test_low_score_chunks_do_not_crowd_out_other_pages():
+    docs = [doc("Top hit sentence.", "https://a", 0.9), doc("Second page sentence.", "https://b", 0.8)]
+    docs += [doc(f"Filler sentence number {i} from page a.", "https://a", 0.05) for i in range(20)]
+    budget = estimate_tokens("Top hit sentence.") + estimate_tokens("Second page sentence.") + 2
+    packed = ContextPacker(max_tokens=budget).pack(docs)
+    assert [block['text'] for block in packed] == ["Top hit sentence.", "Second page sentence."]
+
+
+def test_overlapping_chunks_of_a_page_are_merged():
+    text = " ".join(f"Sentence number {i} talks about topic {i % 3}." for i in range(30))
+    chunks = TextChunker(chunk_size=200, overlap=80, splitter='regex').chunk_text(text, "https://a")
+    docs = [doc(chunk['text'], "https://a", 1.0 - i / 100) for i, chunk in enumerate(chunks[:3])]
+    packed = ContextPacker(max_tokens=10000).pack(docs)
+    assert len(packed) == 1
+    assert packed[0]['text'] == text[:text.index(chunks[2]['text']) + len(chunks[2]['text'])]
+
+
+def test_oversized_top_sentence_is_truncated_not_dropped():
+    long_sentence = "word " * 400 + "end."
+    packed = ContextPacker(max_tokens=50).pack([doc(long_sentence, "https://a", 0.9)])
+    assert len(packed) == 1
+    assert 0 < estimate_tokens(packed[0]['text']) + 1 <= 50
+    assert long_sentence.startswith(packed[0]['text'])
+
+
+def test_tiny_budget_still_packs_something():
+    packed = ContextPacker(max_tokens=1).pack([doc("Supercalifragilistic expialidocious.", "https://a", 0.9)])
+    assert packed and packed[0]['text'] == "Supercalifragilistic"
@@ -0,0 +1,83 @@
+import pytest
+
+from benchmarks.fake_llm import start_fake_llm
+from rag_agent import METRICS, AnswerCache, ContextPacker, RAGPipeline
+
+DOCS = [
+    {'text': "The crawler respects robots.txt and rate limits every host.", 'url': "https://example.com/crawl",
+     'score': 0.9},
+    {'text': "Answers are generated from the retrieved chunks only.", 'url': "https://example.com/answers",
+     'score': 0.5},
+]
+
+
+@pytest.fixture
+def fake_llm(request):
+    # Parametrize with a dict of start_fake_llm options.
+    options = dict({'first_token_delay': 0.05, 'token_delay': 0.0}, **getattr(request, 'param', {}))
+    server, base_url = start_fake_llm(**options)
+    yield server, base_url
+    server.shutdown()
+
+
+def pipeline(base_url, **kwargs):
+    return RAGPipeline("test", base_url=base_url, **dict({'max_retries': 0, 'retry_backoff': 0.0}, **kwargs))
+
+
+def test_generate_stream_yields_deltas_then_final(fake_llm):
+    _, base_url = fake_llm
+    events = list(pipeline(base_url).generate_stream("How does the crawler behave?", DOCS))
+
+    deltas = [event for event in events[:-1] if event['type'] == 'delta']
+    final = events[-1]
+    assert len(deltas) == len(events) - 1 > 1
+    assert final['type'] == 'final'
+    assert final['answer'] == ''.join(delta['text'] for delta in deltas)
+    assert "How does the crawler behave?" in final['answer']
+    assert final['sources'] == ["https://example.com/crawl", "https://example.com/answers"]
+    assert 0.05 <= final['time_to_first_token'] <= final['generation_time']
+    assert final['prompt_tokens']['after'] > 0
+
+
+def test_generate_matches_streamed_answer(fake_llm):
+    _, base_url = fake_llm
+    rag_pipeline = pipeline(base_url)
+    response = rag_pipeline.generate("What are answers based on?", DOCS)
+    final = list(rag_pipeline.generate_stream("What are answers based on?", DOCS))[-1]
+    assert 'error' not in response
+    assert response['answer'] == final['answer'].strip()
+
+
+@pytest.mark.parametrize('fake_llm', [{'error_rate': 1.0}], indirect=True)
+def test_errors_end_the_stream_with_a_final_event(fake_llm):
+    server, base_url = fake_llm
+    events = list(pipeline(base_url, max_retries=2).generate_stream("Anything?", DOCS))
+
+    assert [event['type'] for event in events] == ['final']
+    assert events[0]['time_to_first_token'] is None
+    assert events[0]['sources'] == []
+    assert server.request_count == 3
+    assert 'error' in pipeline(base_url).generate("Anything?", DOCS)
+
+
+@pytest.mark.parametrize('fake_llm', [{'error_rate': 0.5, 'seed': 3}], indirect=True)
+def test_failed_requests_are_retried(fake_llm):
+    server, base_url = fake_llm
+    METRICS.reset()
+    rag_pipeline = pipeline(base_url, max_retries=10)
+    responses = [rag_pipeline.generate(f"Question {i}?", DOCS) for i in range(5)]
+
+    assert all('error' not in response for response in responses)
+    retries = sum(record['value'] for record in METRICS.snapshot() if record['name'] == 'rag_llm_retries_total')
+    assert retries > 0
+    assert server.request_count == len(responses) + retries
+
+
+def test_answer_cache_is_keyed_on_the_context_budget(fake_llm):
+    server, base_url = fake_llm
+    rag_pipeline = pipeline(base_url, answer_cache=AnswerCache(), context_packer=ContextPacker(max_tokens=2000))
+    rag_pipeline.generate("How does the crawler behave?", DOCS)
+    assert rag_pipeline.generate("how does the crawler behave", DOCS).get('cached')
+    rag_pipeline.context_packer = ContextPacker(max_tokens=20)
+    assert not rag_pipeline.generate("How does the crawler behave?", DOCS).get('cached')
+    assert server.request_count == 2
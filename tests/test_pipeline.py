@@ -0,0 +1,67 @@
+from rag_agent import ChunkDeduplicator, RAGPipeline, TextChunker
+
+CHUNKER = TextChunker(chunk_size=120, overlap=0, splitter='regex')
+
+
+def urls(rag_pipeline):
+    return sorted(set(rag_pipeline.vector_db.urls))
+
+
+def test_recrawl_replaces_pages_indexed_under_a_url_variant():
+    rag_pipeline = RAGPipeline("test")
+    rag_pipeline.index_stream([{'url': "https://example.com/docs/", 'text': "Old docs text about rockets."}], CHUNKER)
+    rag_pipeline.index_stream([{'url': "https://example.com/docs#top", 'text': "New docs text about boats."}],
+                              CHUNKER, replace_existing=True)
+
+    assert urls(rag_pipeline) == ["https://example.com/docs#top"]
+    assert rag_pipeline.retrieve("rockets") == []
+
+
+BLURB = "Our company has been serving customers with handmade widgets since nineteen eighty two, worldwide."
+
+
+def page(url, topic):
+    return {'url': url, 'text': f"This page is all about {topic} and nothing else at all.\n\n{BLURB}"}
+
+
+def search_blurb(rag_pipeline):
+    return rag_pipeline.retrieve("handmade widgets worldwide", top_k=5)
+
+
+def test_dedup_keeps_one_copy_with_every_source():
+    rag_pipeline = RAGPipeline("test")
+    rag_pipeline.index_stream([page("https://a", "rockets"), page("https://b", "gardens")], CHUNKER,
+                              deduplicator=ChunkDeduplicator())
+    results = search_blurb(rag_pipeline)
+    assert len(results) == 1
+    assert results[0]['sources'] == ["https://a", "https://b"]
+
+
+def test_shared_chunk_survives_when_its_first_page_changes(tmp_path):
+    rag_pipeline = RAGPipeline("test")
+    rag_pipeline.index_stream([page("https://a", "rockets"), page("https://b", "gardens")], CHUNKER,
+                              deduplicator=ChunkDeduplicator())
+    rag_pipeline.save(str(tmp_path))
+
+    # A drops the blurb; B is unchanged and not recrawled.
+    rag_pipeline = RAGPipeline.load(str(tmp_path), "test")
+    changed = {'url': "https://a", 'text': "This page is now all about submarines instead."}
+    rag_pipeline.index_stream([changed], CHUNKER, replace_existing=True, deduplicator=ChunkDeduplicator())
+    assert [doc['url'] for doc in search_blurb(rag_pipeline)] == ["https://b"]
+
+    # A adds the blurb back: it is merged into the indexed chunk.
+    deduplicator = ChunkDeduplicator()
+    rag_pipeline.index_stream([page("https://a", "submarines")], CHUNKER, replace_existing=True,
+                              deduplicator=deduplicator)
+    results = search_blurb(rag_pipeline)
+    assert len(results) == 1 and results[0]['sources'] == ["https://b", "https://a"]
+    assert deduplicator.removed == 1
+    assert rag_pipeline.retrieve("submarines", top_k=1)[0]['url'] == "https://a"
+
+
+def test_dedup_is_not_seeded_without_changed_pages():
+    rag_pipeline = RAGPipeline("test")
+    rag_pipeline.index_stream([page("https://a", "rockets")], CHUNKER)
+    deduplicator = ChunkDeduplicator()
+    rag_pipeline.index_stream([], CHUNKER, replace_existing=True, deduplicator=deduplicator)
+    assert deduplicator._urls == []
@@ -0,0 +1,59 @@
+import pytest
+
+from benchmarks.synthetic_site import generate_site, start_site_server
+from rag_agent import CrawlFrontier, PageCache, WebScraper, canonicalize_url
+
+
+@pytest.fixture
+def site():
+    server, base_url = start_site_server(generate_site(8, links_per_page=3, seed=1))
+    yield server, base_url
+    server.shutdown()
+
+
+def crawl(base_url, **kwargs):
+    return WebScraper(base_url, max_pages=20, requests_per_second=0, use_sitemap=False, **kwargs).scrape()
+
+
+def test_recrawl_revalidates_unchanged_pages_from_the_cache(site, tmp_path):
+    server, base_url = site
+    first = crawl(base_url, cache=PageCache(str(tmp_path)))
+    assert len(first) == 8 and not any(page.get('unchanged') for page in first)
+
+    second = crawl(base_url, cache=PageCache(str(tmp_path)))
+    assert all(page.get('unchanged') for page in second)
+    assert {page['url']: page['text'] for page in second} == {page['url']: page['text'] for page in first}
+
+    server.pages['/page/3'] = server.pages['/page/3'].replace('<h1>Page 3</h1>', '<h1>Page 3, edited</h1>')
+    third = {page['url']: page for page in crawl(base_url, cache=PageCache(str(tmp_path)))}
+    assert not third[base_url + 'page/3'].get('unchanged')
+    assert 'edited' in third[base_url + 'page/3']['text']
+    assert sum(page.get('unchanged', False) for page in third.values()) == 7
+
+
+def test_canonicalize_url():
+    url = "HTTP://Example.COM:80/docs/?utm_source=x&b=2&a=1#intro"
+    assert canonicalize_url(url) == "http://example.com/docs?a=1&b=2"
+    assert canonicalize_url("https://example.com") == canonicalize_url("https://example.com/")
+    assert canonicalize_url("https://example.com:8443/a/") == "https://example.com:8443/a"
+
+
+def test_frontier_dedups_variants_but_fetches_the_url_as_given():
+    frontier = CrawlFrontier()
+    assert frontier.push("https://example.com/docs/#top", 1)
+    assert not frontier.push("https://example.com/docs?utm_campaign=x", 1)
+    assert frontier.push("https://example.com/", 0, score=0.5)
+    assert frontier.pop() == ("https://example.com/", 0)
+    assert frontier.pop() == ("https://example.com/docs/", 1)
+    assert not frontier
+
+
+def test_relative_links_resolve_against_directory_urls():
+    pages = {'/docs/': '<html><body><p>Docs index.</p><a href="intro.html">Intro</a></body></html>',
+             '/docs/intro.html': '<html><body><p>Intro.</p><a href="./">Up</a></body></html>'}
+    server, base_url = start_site_server(pages)
+    try:
+        urls = sorted(page['url'] for page in crawl(base_url + 'docs/'))
+    finally:
+        server.shutdown()
+    assert urls == [base_url + 'docs/', base_url + 'docs/intro.html']
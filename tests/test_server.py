@@ -0,0 +1,86 @@
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import urlparse
+
+import pytest
+
+from benchmarks.fake_llm import start_fake_llm
+from rag_agent import RAGPipeline, SimpleVectorDB
+from server import MAX_BODY_BYTES, QueryService, start_service
+
+
+@pytest.fixture
+def service():
+    llm_server, llm_url = start_fake_llm(first_token_delay=0.2, token_delay=0.0)
+    vector_db = SimpleVectorDB()
+    vector_db.add_documents(["cats purr softly", "dogs bark loudly", "fish swim slowly"],
+                            ["https://example.com/cats", "https://example.com/dogs", "https://example.com/fish"])
+    query_service = QueryService(RAGPipeline("test", vector_db=vector_db, base_url=llm_url, max_retries=0))
+    thread, base_url = start_service(query_service)
+    yield urlparse(base_url), llm_server
+    thread.shutdown()
+    query_service.close()
+    llm_server.shutdown()
+
+
+def raw_request(url, data):
+    with socket.create_connection((url.hostname, url.port), timeout=5) as sock:
+        sock.sendall(data)
+        response = b''
+        while chunk := sock.recv(65536):
+            response += chunk
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+@pytest.mark.parametrize('length, status', [('-5', 400), ('abc', 400), (str(MAX_BODY_BYTES + 1), 413)])
+def test_bad_content_length_gets_an_error_response(service, length, status):
+    url, _ = service
+    request = f"POST /retrieve HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n".encode('latin-1')
+    code, body = raw_request(url, request)
+    assert code == status and body['error']
+
+
+def test_malformed_and_chunked_requests_are_rejected(service):
+    url, _ = service
+    assert raw_request(url, b"NONSENSE\r\n\r\n")[0] == 400
+    chunked = b"POST /retrieve HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n"
+    assert raw_request(url, chunked)[0] == 400
+
+
+def request(url, method, path, body=None):
+    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+    connection.request(method, path, json.dumps(body) if body is not None else None)
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def test_retrieve_and_validation(service):
+    url, _ = service
+    status, body = request(url, 'POST', '/retrieve', {'query': "dogs bark", 'top_k': 1})
+    assert status == 200 and [doc['url'] for doc in body['results']] == ["https://example.com/dogs"]
+    assert request(url, 'POST', '/retrieve', {'query': "dogs", 'top_k': 99})[0] == 400
+    assert request(url, 'POST', '/retrieve', {'top_k': 1})[0] == 400
+    assert request(url, 'DELETE', '/answer')[0] == 405
+    assert request(url, 'GET', '/nowhere')[0] == 404
+
+
+def test_identical_in_flight_answers_share_one_llm_call(service):
+    url, llm_server = service
+    results = []
+
+    def ask():
+        results.append(request(url, 'POST', '/answer', {'query': "Do cats purr?"}))
+
+    threads = [threading.Thread(target=ask) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [status for status, _ in results] == [200] * 5
+    assert len({body['answer'] for _, body in results}) == 1
+    assert llm_server.request_count == 1
@@ -0,0 +1,47 @@
+import pytest
+
+from rag_agent import ShardedIndex, SimpleVectorDB
+
+
+def shard(texts, site):
+    db = SimpleVectorDB()
+    db.add_documents(texts, [f"https://{site}/{i}" for i in range(len(texts))])
+    db.refresh()
+    return db
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    index = ShardedIndex(str(tmp_path))
+    yield index
+    index.close()
+
+
+def test_merge_ranks_on_cosine_across_dense_and_sparse_shards(sharded):
+    # Many chunks of the docs shard are about the query; the blog shard has one weaker mention.
+    docs = [f"rocket engine thrust tuning guide part {i}" for i in range(30)] + ["rocket engine thrust"]
+    blog = ["weekend hiking trip photos", "rocket engine noise at the fair", "recipes for summer salads"]
+    sharded.add_shard('docs', shard(docs, 'docs.example.com'))
+    sharded.add_shard('blog', shard(blog, 'blog.example.com'))
+
+    results = sharded.search("rocket engine thrust", top_k=3)
+    assert [doc['shard'] for doc in results] == ['docs', 'docs', 'docs']
+    assert results[0]['text'] == "rocket engine thrust"
+    assert [doc['score'] for doc in results] == sorted((doc['score'] for doc in results), reverse=True)
+
+    results = sharded.search("rocket engine noise", top_k=1)
+    assert results[0]['shard'] == 'blog'
+
+
+def test_rebuild_and_remove_shards(sharded, tmp_path):
+    sharded.add_shard('a', shard(["cats purr softly"], 'a.example.com'))
+    sharded.add_shard('a', shard(["dogs bark loudly"], 'a.example.com'))
+    reopened = ShardedIndex(str(tmp_path))
+    assert reopened.search("dogs bark", top_k=1)[0]['url'] == "https://a.example.com/0"
+    assert reopened.search("cats purr", top_k=1) == []
+
+    reopened.remove_shard('a')
+    with pytest.raises(ValueError):
+        reopened.remove_shard('a')
+    reopened.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['manifest.json']
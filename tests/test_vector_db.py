@@ -0,0 +1,110 @@
+import json
+import os
+
+import pytest
+
+from rag_agent import SimpleVectorDB
+
+TEXTS = ["cats purr softly on the warm sofa", "dogs bark loudly at the mail carrier",
+         "fish swim slowly in the garden pond", "rockets fly to space from the launch pad"]
+URLS = [f"https://example.com/{i}" for i in range(len(TEXTS))]
+
+
+def build_db(**kwargs):
+    db = SimpleVectorDB(**kwargs)
+    db.add_documents(TEXTS, URLS)
+    db.refresh()
+    return db
+
+
+def test_save_over_a_loaded_index(tmp_path):
+    path = str(tmp_path / 'index')
+    build_db().save(path)
+    loaded = SimpleVectorDB.load(path)
+    expected = loaded.search("dogs bark", top_k=2)
+    loaded.save(path)
+    loaded.save(path)
+
+    reloaded = SimpleVectorDB.load(path)
+    assert list(reloaded.documents) == TEXTS
+    assert reloaded.search("dogs bark", top_k=2) == expected
+    assert os.listdir(tmp_path) == ['index']
+
+
+def test_save_keeps_other_files_in_the_directory(tmp_path):
+    (tmp_path / 'notes.txt').write_text("keep me")
+    (tmp_path / 'data').mkdir()
+    build_db().save(str(tmp_path))
+
+    assert (tmp_path / 'notes.txt').read_text() == "keep me"
+    assert (tmp_path / 'data').is_dir()
+    assert sorted(name for name in os.listdir(tmp_path) if name.startswith('.')) == []
+    assert len(SimpleVectorDB.load(str(tmp_path)).documents) == len(TEXTS)
+
+
+def test_save_into_the_current_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    build_db().save('.')
+    assert SimpleVectorDB.load('.').search("rockets", top_k=1)[0]['url'] == URLS[3]
+
+
+CORPUS = [f"{a} {b} report on {c} systems" for a in ("cache", "crawler", "index", "vector")
+          for b in ("latency", "memory", "throughput") for c in ("storage", "network", "parser")]
+QUERIES = ["cache latency", "network parser", "vector memory storage", "crawler throughput"]
+
+
+def scores(db):
+    # Every document's score, as the top-k order among ties is arbitrary.
+    return [{doc['url']: round(doc['score'], 9) for doc in db.search(query, top_k=len(CORPUS))} for query in QUERIES]
+
+
+def corpus_urls(texts):
+    return [f"https://example.com/{CORPUS.index(text)}" for text in texts]
+
+
+def test_incremental_batches_match_a_bulk_fit():
+    bulk = SimpleVectorDB()
+    bulk.add_documents(CORPUS, corpus_urls(CORPUS))
+    for db in (SimpleVectorDB(incremental=True), SimpleVectorDB(incremental=True, auto_refresh=False)):
+        for start in range(0, len(CORPUS), 7):
+            db.add_documents(CORPUS[start:start + 7], corpus_urls(CORPUS[start:start + 7]))
+        db.refresh()
+        assert scores(db) == scores(bulk)
+
+
+def test_incremental_removal_updates_document_frequencies():
+    kept = [text for text in CORPUS if not text.startswith("cache")]
+    db = SimpleVectorDB(incremental=True)
+    db.add_documents(CORPUS, corpus_urls(CORPUS))
+    removed = db.remove_urls(corpus_urls([text for text in CORPUS if text.startswith("cache")]))
+    assert removed == len(CORPUS) - len(kept)
+
+    rebuilt = SimpleVectorDB(incremental=True)
+    rebuilt.add_documents(kept, corpus_urls(kept))
+    assert scores(db) == scores(rebuilt)
+
+
+@pytest.mark.parametrize('options', [{}, {'incremental': True}, {'incremental': True, 'n_features': 2 ** 12}])
+def test_save_load_round_trip(tmp_path, options):
+    db = SimpleVectorDB(**options)
+    db.add_documents(CORPUS, corpus_urls(CORPUS))
+    db.save(str(tmp_path))
+
+    loaded = SimpleVectorDB.load(str(tmp_path))
+    assert list(loaded.documents) == CORPUS
+    assert list(loaded.urls) == corpus_urls(CORPUS)
+    assert scores(loaded) == scores(db)
+
+    extra = "cache latency report on disk systems"
+    loaded.add_documents([extra], ["https://example.com/extra"])
+    db.add_documents([extra], ["https://example.com/extra"])
+    assert scores(loaded) == scores(db)
+
+
+def test_load_rejects_other_index_versions(tmp_path):
+    build_db().save(str(tmp_path))
+    meta = json.loads((tmp_path / 'index.json').read_text())
+    meta['version'] = 1
+    (tmp_path / 'index.json').write_text(json.dumps(meta))
+    with pytest.raises(ValueError, match="rebuild the index"):
+        SimpleVectorDB.load(str(tmp_path))